@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:46
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_story_counts(apps, schema_editor):
+    Category = apps.get_model("category", "Category")
+    through = apps.get_model("story", "Story").categories.through
+    counts = (
+        through.objects.filter(category_id=OuterRef("pk"))
+        .order_by().values("category_id")
+        .annotate(count=Count("pk")).values("count")
+    )
+    Category.objects.update(story_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('category', '0001_squashed_0006_alter_category_description'),
+        ('story', '0001_squashed_0017_alter_story_slug'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='story_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_story_counts, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,26 @@
 from django.conf import settings
 from django.db import models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from config.response_cache import bump_versions
+
+
+class CategoryQuerySet(models.QuerySet):
+    def refresh_story_counts(self):
+        # one UPDATE for the whole set, counted from the story m2m table
+        through = self.model.story_set.through
+        counts = (
+            through.objects.filter(category_id=OuterRef("pk"))
+            .order_by().values("category_id")
+            .annotate(count=Count("pk")).values("count")
+        )
+        updated = self.update(story_count=Coalesce(Subquery(counts), 0))
+        # update() sends no signals, and the cached tree shows the counts
+        from .tree import invalidate_tree
+        invalidate_tree()
+        bump_versions("categories")
+        return updated
 
 
 # Create your models here.
@@ -13,6 +34,10 @@ class Category(models.Model):
     old_brawna_term_id = models.IntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
+    # maintained by story.signals, rebuilt by rebuild_story_counts
+    story_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = CategoryQuerySet.as_manager()
 
     def __str__(self):
         if self.parent:
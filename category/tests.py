@@ -1,3 +1,4 @@
+from django.core.cache import cache
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient, APITestCase
@@ -5,10 +6,13 @@ from rest_framework.test import APIClient, APITestCase
 from accounts.models import User
 from category.models import Category
 from category.serializers import CategorySerializer
+from category.tree import CACHE_KEY
+from story.models import Story
 
 
 class CategoryListRetrieveAPIViewTestCase(APITestCase):
     def setUp(self):
+        cache.clear()
         self.category_1 = Category.objects.create(name="Test category 1")
         self.category_2 = Category.objects.create(name="Test category 2")
 
@@ -19,6 +23,17 @@ class CategoryListRetrieveAPIViewTestCase(APITestCase):
         self.assertEqual(response.data, serializer.data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_list_is_cached_until_a_category_changes(self):
+        url = reverse("category:category-list")
+        self.assertEqual(self.client.get(url)["X-Cache"], "MISS")
+        self.assertEqual(self.client.get(url)["X-Cache"], "HIT")
+        self.category_2.name = "Renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category_2.save()
+        response = self.client.get(url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data[1]["name"], "Renamed")
+
     def test_with_single_category_returns_ok(self):
         url = reverse("category:category-info", args=[self.category_2.id])
         response = self.client.get(url)
@@ -144,3 +159,97 @@ class CategoryDeletedAPIViewTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
         self.assertTrue(Category.objects.filter(pk=self.category.pk).exists())   
 
+
+class CategoryStoryCountTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.category = Category.objects.create(name="Test category 1")
+        self.story1 = Story.objects.create(title="story1", slug="story1", user=self.user)
+        self.story2 = Story.objects.create(title="story2", slug="story2", user=self.user)
+
+    def test_count_follows_story_categories(self):
+        self.story1.categories.add(self.category)
+        self.story2.categories.add(self.category)
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.story_count, 2)
+        self.story1.categories.clear()
+        self.story2.delete()
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.story_count, 0)
+
+    def test_list_reads_stored_count(self):
+        self.story1.categories.add(self.category)
+        Category.objects.create(name="Test category 2")
+        response = self.client.get(reverse("category:category-list"))
+        self.assertEqual(response.data[0]["story_count"], 1)
+        self.assertEqual(response.data[1]["story_count"], 0)
+
+
+class CategoryTreeAPIViewTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.url = reverse("category:category-tree")
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.fiction = Category.objects.create(name="Fiction")
+        self.horror = Category.objects.create(name="Horror", parent=self.fiction)
+        self.comedy = Category.objects.create(name="Comedy", parent=self.fiction)
+        self.poetry = Category.objects.create(name="Poetry")
+
+    def test_builds_nested_tree_in_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([node["name"] for node in response.data], ["Fiction", "Poetry"])
+        fiction = response.data[0]
+        self.assertEqual([node["name"] for node in fiction["children"]], ["Comedy", "Horror"])
+        self.assertEqual(fiction["children"][0]["children"], [])
+        self.assertEqual(fiction["story_count"], 0)
+
+    def test_second_request_is_served_from_cache(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_if_none_match_returns_not_modified(self):
+        etag = self.client.get(self.url)["ETag"]
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_save_invalidates_tree(self):
+        etag = self.client.get(self.url)["ETag"]
+        self.poetry.parent = self.fiction
+        with self.captureOnCommitCallbacks(execute=True):
+            self.poetry.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data[0]["children"]), 3)
+
+    def test_delete_invalidates_tree(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.fiction.delete()
+        response = self.client.get(self.url)
+        self.assertEqual([node["name"] for node in response.data], ["Poetry"])
+
+    def test_story_count_change_invalidates_tree(self):
+        self.client.get(self.url)
+        story = Story.objects.create(title="story", slug="story", user=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            story.categories.add(self.horror)
+        response = self.client.get(self.url)
+        self.assertEqual(response.data[0]["children"][1]["story_count"], 1)
+
+    def test_tree_is_dropped_once_the_change_is_committed(self):
+        etag = self.client.get(self.url)["ETag"]
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.poetry.parent = self.fiction
+            self.poetry.save()
+            # a request before the commit would see, and cache, the old rows
+            self.assertEqual(cache.get(CACHE_KEY)[0], etag)
+        for callback in callbacks:
+            callback()
+        self.assertIsNone(cache.get(CACHE_KEY))
@@ -0,0 +1,48 @@
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import quote_etag
+
+from .models import Category
+
+CACHE_KEY = "category:tree"
+# A tree built while a change was being committed can hold the old rows
+# and be stored after invalidate_tree() ran; this bounds how long.
+CACHE_TIMEOUT = 60
+
+
+def build_tree():
+    """
+    The whole hierarchy from a single query, roots and children ordered by
+    name. Categories whose parent is missing are treated as roots.
+    """
+    rows = Category.objects.order_by("name", "id").values(
+        "id", "name", "description", "parent_id", "story_count")
+    nodes = {row["id"]: dict(row, children=[]) for row in rows}
+    roots = []
+    for node in nodes.values():
+        parent = nodes.get(node.pop("parent_id"))
+        (parent["children"] if parent else roots).append(node)
+    return roots
+
+
+def get_tree():
+    """
+    (etag, tree), built on a cache miss. The ETag is a digest of the tree
+    so it only changes when the response would.
+    """
+    cached = cache.get(CACHE_KEY)
+    if cached is None:
+        tree = build_tree()
+        digest = hashlib.sha1(json.dumps(tree, sort_keys=True).encode()).hexdigest()
+        cached = (quote_etag(digest), tree)
+        cache.set(CACHE_KEY, cached, CACHE_TIMEOUT)
+    return cached
+
+
+def invalidate_tree():
+    # once the change is committed, or a request in between would cache
+    # the rows from before it
+    transaction.on_commit(lambda: cache.delete(CACHE_KEY))
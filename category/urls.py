@@ -3,6 +3,7 @@ from django.urls import path
 from category.views import (
     CategoryCreateAPIView,
     CategoryListAPIView,
+    CategoryTreeAPIView,
     CategoryUpdateAPIView,
     CategoryRetrieveAPIView,
     CategoryDeleteAPIView
@@ -11,6 +12,7 @@ from category.views import (
 app_name = "category"
 urlpatterns = [
     path("/list/", CategoryListAPIView.as_view(), name="category-list"),
+    path("/tree/", CategoryTreeAPIView.as_view(), name="category-tree"),
     path("/add/", CategoryCreateAPIView.as_view(), name="category-create"),
     path(
         "/change/<int:id>/",
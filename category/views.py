@@ -1,13 +1,29 @@
+from django.utils.cache import get_conditional_response
 from rest_framework import generics
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
 from accounts.permissions import IsAdmin
 from category.models import Category
 from category.serializers import CategorySerializer
+from category.tree import get_tree
+from config.response_cache import CachedResponseMixin
 
-class CategoryListAPIView(generics.ListAPIView):
+class CategoryListAPIView(CachedResponseMixin, generics.ListAPIView):
     serializer_class = CategorySerializer
+    cache_versions = ("categories",)
     pagination_class = None
-    queryset = Category.objects.all()
+    queryset = Category.objects.select_related("parent")
+
+class CategoryTreeAPIView(APIView):
+    # nested hierarchy with story counts, served from cache
+    def get(self, request):
+        etag, tree = get_tree()
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified["ETag"] = etag
+            return not_modified
+        return Response(tree, headers={"ETag": etag})
 
 class CategoryCreateAPIView(generics.CreateAPIView):
     serializer_class = CategorySerializer
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comment', '0001_initial'),
+        ('story', '0021_story_feed_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['story', 'created_at', 'id'], name='comment_story_idx'),
+        ),
+    ]
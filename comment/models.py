@@ -7,6 +7,12 @@ from story.models import Story
 User = get_user_model()
 
 
+class CommentQuerySet(models.QuerySet):
+    def for_list(self):
+        # CommentSerializer reads user.alias and story.title
+        return self.select_related("user", "story")
+
+
 class Comment(models.Model):
     body = models.TextField()
     created_at = models.DateTimeField(default=timezone.now)
@@ -14,8 +20,14 @@ class Comment(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     story = models.ForeignKey(Story, on_delete=models.CASCADE)
 
+    objects = CommentQuerySet.as_manager()
+
     class Meta:
         ordering = ["created_at"]
+        indexes = [
+            # a story's comments, oldest first, and their keyset cursor
+            models.Index(fields=["story", "created_at", "id"], name="comment_story_idx"),
+        ]
 
     def __str__(self):
         return f"{self.user.username}'s comment on {self.story.slug}"
@@ -0,0 +1,6 @@
+from story.pagination import FeedPagination
+
+
+class CommentPagination(FeedPagination):
+    # comments read oldest first, as in Comment.Meta.ordering
+    ordering = ("created_at", "id")
@@ -0,0 +1,13 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from config.response_cache import bump_versions
+
+from .models import Comment
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_changed(sender, instance, **kwargs):
+    # comments are only embedded in their story's detail
+    bump_versions(f"story:{instance.story_id}")
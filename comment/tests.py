@@ -98,6 +98,19 @@ class CommentListAPIViewTestCase(WithExistingStory):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_with_cursor_returns_keyset_pages(self):
+        comments = [self.comment1, self.comment2] + [
+            self.createComment(f"Post {i}", self.doguser, self.catstory1) for i in range(3)]
+        # story lookup and one page, whatever the page size
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, {"cursor": "", "page_size": 4})
+        self.assertEqual(set(response.data), {"next", "results"})
+        self.assertEqual(
+            [c["id"] for c in response.data["results"]], [c.id for c in comments[:4]])
+        response = self.client.get(response.data["next"])
+        self.assertEqual([c["id"] for c in response.data["results"]], [comments[4].id])
+        self.assertIsNone(response.data["next"])
+
 class CommentCreateAPIViewTestCase(WithExistingStory):
 
     def setUp(self):
@@ -8,11 +8,13 @@ from accounts.permissions import IsAdmin, IsAuth
 from story.models import Story
 
 from .models import Comment
+from .pagination import CommentPagination
 from .serializers import CommentSerializer
 
 
 class CommentListAPIView(generics.ListAPIView):
     serializer_class = CommentSerializer
+    pagination_class = CommentPagination
     queryset = Comment.objects.all()
 
     def get_queryset(self):
@@ -20,13 +22,13 @@ class CommentListAPIView(generics.ListAPIView):
             story = Story.objects.get(id=self.kwargs["storyid"])
         except Exception:
             raise ValidationError("Invalid story id provided.")
-        queryset = Comment.objects.filter(story=story)
+        queryset = Comment.objects.filter(story=story).for_list().order_by("created_at", "id")
         return queryset
 
 
 class CommentListAdminAPIView(generics.ListAPIView):
     serializer_class = CommentSerializer
-    queryset = Comment.objects.all().order_by("-created_at")
+    queryset = Comment.objects.for_list().order_by("-created_at")
     permission_classes = [IsAdmin]
     pagination_class = PageNumberPagination
 
@@ -0,0 +1,148 @@
+"""
+Response cache for the public read endpoints.
+
+Entries are keyed on the request (host, path, query string, Accept) and
+on the current number of every version the view depends on, e.g.
+"stories" or "story:42". Signal receivers bump those numbers once a
+change to the data behind them is committed, so stale entries are
+simply never looked up again and drop out of the cache on their own.
+
+Versions only reach other processes through a shared cache backend. With
+one local to each process (LocMemCache, the default) a write in one
+worker never bumps another's, so there entries are kept for
+RESPONSE_CACHE_LOCAL_TIMEOUT seconds and the timeout bounds how stale
+they get; with a shared backend it only bounds memory.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+
+PREFIX = "response-cache"
+STATS = ("hits", "misses")
+
+
+def is_shared():
+    # whether every process sees the same cache, and so the same versions
+    return not isinstance(caches["default"], (LocMemCache, DummyCache))
+
+
+def timeout():
+    shared = getattr(settings, "RESPONSE_CACHE_TIMEOUT", 60 * 60 * 24)
+    if is_shared():
+        return shared
+    return min(shared, getattr(settings, "RESPONSE_CACHE_LOCAL_TIMEOUT", 60))
+
+
+def version_key(name):
+    return f"{PREFIX}:version:{name}"
+
+
+def get_versions(names):
+    keys = [version_key(name) for name in names]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Start from the clock rather than 0, so a version that was
+            # evicted can't come back to a number already used for entries.
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(*names):
+    # Once the writer's transaction commits (at once outside one): a request
+    # in between would still read the old rows and cache them under the
+    # new version.
+    transaction.on_commit(lambda: incr_versions(names))
+
+
+def incr_versions(names):
+    for name in names:
+        try:
+            cache.incr(version_key(name))
+        except ValueError:
+            # never read, so no entry depends on it
+            pass
+
+
+def count(stat):
+    key = f"{PREFIX}:{stat}"
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def get_stats():
+    values = cache.get_many([f"{PREFIX}:{stat}" for stat in STATS])
+    return {stat: values.get(f"{PREFIX}:{stat}", 0) for stat in STATS}
+
+
+def reset_stats():
+    cache.delete_many([f"{PREFIX}:{stat}" for stat in STATS])
+
+
+class CachedResponseMixin:
+    """
+    Serve anonymous GETs from the cache. cache_versions names what the
+    response depends on and may use the view's URL kwargs, e.g.
+    "story:{id}". Requests carrying credentials always go to the view.
+    """
+
+    cache_versions = ()
+
+    def get_cache_versions(self, kwargs):
+        return [name.format(**kwargs) for name in self.cache_versions]
+
+    def is_cacheable(self, request):
+        if request.method not in ("GET", "HEAD") or "HTTP_AUTHORIZATION" in request.META:
+            return False
+        return not self.initialize_request(request).user.is_authenticated
+
+    def get_cache_key(self, request, kwargs):
+        names = self.get_cache_versions(kwargs)
+        parts = [
+            request.get_host(),
+            request.get_full_path(),
+            request.META.get("HTTP_ACCEPT", ""),
+            *(f"{name}={version}" for name, version in zip(names, get_versions(names))),
+        ]
+        digest = hashlib.sha1("\n".join(parts).encode()).hexdigest()
+        return f"{PREFIX}:response:{digest}"
+
+    def dispatch(self, request, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return super().dispatch(request, *args, **kwargs)
+
+        key = self.get_cache_key(request, kwargs)
+        cached = cache.get(key)
+        if cached is not None:
+            count("hits")
+            content, content_type, etag = cached
+            response = etag and get_conditional_response(request, etag=etag)
+            if not response:
+                response = HttpResponse(content, content_type=content_type)
+            if etag:
+                response["ETag"] = etag
+            response["X-Cache"] = "HIT"
+            return response
+
+        count("misses")
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code == 200:
+            response.render()
+            cache.set(
+                key,
+                (response.content, response["Content-Type"], response.get("ETag")),
+                timeout(),
+            )
+        response["X-Cache"] = "MISS"
+        return response
@@ -101,6 +101,27 @@ DATABASES = {
         "PORT": os.getenv("DJANGO_DB_PORT",""),
     }
 }
+if DATABASES["default"]["ENGINE"] == "django.db.backends.sqlite3":
+    # a file rather than the in-memory default, where concurrent writers
+    # fail at once instead of waiting, so threaded tests can run
+    DATABASES["default"]["TEST"] = {"NAME": BASE_DIR / "test_db.sqlite3"}
+
+# The response cache is invalidated by bumping keys in this cache, which
+# only reaches other worker processes when it is shared (e.g.
+# django.core.cache.backends.redis.RedisCache). With the per-process
+# default, cached responses are kept for RESPONSE_CACHE_LOCAL_TIMEOUT
+# seconds instead (see config.response_cache).
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("DJANGO_CACHE_BACKEND","django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("DJANGO_CACHE_LOCATION",""),
+    }
+}
+RESPONSE_CACHE_TIMEOUT = int(os.getenv("RESPONSE_CACHE_TIMEOUT", 60 * 60 * 24))
+RESPONSE_CACHE_LOCAL_TIMEOUT = int(os.getenv("RESPONSE_CACHE_LOCAL_TIMEOUT", 60))
+
+# finished story downloads, see story.export
+EXPORT_ROOT = Path(os.getenv("DJANGO_EXPORT_ROOT", BASE_DIR / "exports"))
 
 
 # Password validation
@@ -21,7 +21,7 @@ from rest_framework_simplejwt.views import (
     TokenVerifyView,
 )
 
-from .views import MyTokenObtainPairView, verify_recaptcha
+from .views import MyTokenObtainPairView, response_cache_stats, verify_recaptcha
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -34,4 +34,5 @@ urlpatterns = [
     path("api/v1/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     path("api/v1/token/verify/", TokenVerifyView.as_view(), name="token_verify"),
     path("api/v1/verify-recaptcha/", verify_recaptcha, name="verify_recaptcha"),
+    path("api/v1/cache-stats/", response_cache_stats, name="response_cache_stats"),
 ]
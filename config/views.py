@@ -1,10 +1,12 @@
 from rest_framework_simplejwt.views import TokenObtainPairView
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status
 from .serializers import MyTokenObtainPairSerializer
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from accounts.models import User
+from accounts.permissions import IsAdmin
+from .response_cache import get_stats
 import requests
 import os
 
@@ -28,6 +30,11 @@ class MyTokenObtainPairView(TokenObtainPairView):
 
         return Response(serializer.validated_data, status=status.HTTP_200_OK)
 
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def response_cache_stats(request):
+    return Response(get_stats())
+
 @api_view(['POST'])
 def verify_recaptcha(request):
     # Get the token from the request
@@ -17,3 +17,27 @@ dotenv.load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), '.en
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 
 application = get_wsgi_application()
+
+# Build the in-memory indexes before the first request needs them, off
+# the import: the deploy reloads workers before it migrates, and one
+# that can't build them yet must still start. The first request that
+# needs an index builds it then.
+import logging  # noqa: E402
+import threading  # noqa: E402
+
+from django.db import connection  # noqa: E402
+
+from story import facets, typeahead  # noqa: E402
+
+
+def warm_indexes():
+    try:
+        for index in (typeahead, facets):
+            index.get_index()
+    except Exception:
+        logging.getLogger(__name__).exception("Could not build the in-memory indexes")
+    finally:
+        connection.close()
+
+
+threading.Thread(target=warm_indexes, name="warm indexes", daemon=True).start()
@@ -10,4 +10,8 @@ if ! python manage.py migrate --check ; then
 else
     echo "No migrations"
 fi
+# columns added by a migration start out empty; fills in only those
+python manage.py backfill_excerpts --missing
+python manage.py rebuild_search_index --missing
+python manage.py rerender_chapters
 
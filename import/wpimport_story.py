@@ -204,8 +204,7 @@ for (ID, post_name, post_date, post_author,post_title, post_parent, post_content
         )
         Chapter.objects.filter(title=post_title).update(created_at=post_date)
         
-        order = StoryChapters.objects.filter(story=parent).count() + 1
-        storychapter = StoryChapters.objects.create(story = parent, chapter = chapter, order = order)    
+        storychapter = StoryChapters.objects.insert(parent, chapter)    
 
 cnx.close()
 
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Story, StoryChapters, Chapter
+from .models import Story, StoryChapters, Chapter, ChapterContent
 
 # Register your models here.
 
@@ -12,5 +12,13 @@ class StoryChaptersInline(admin.TabularInline):
 class StoryAdmin(admin.ModelAdmin):
     inlines = [StoryChaptersInline]
 
+class ChapterContentInline(admin.StackedInline):
+    model = ChapterContent
+    can_delete = False
+
+class ChapterAdmin(admin.ModelAdmin):
+    # the changelist only shows metadata; the text is loaded on the change form
+    inlines = [ChapterContentInline]
+
 admin.site.register(Story, StoryAdmin)
-admin.site.register(Chapter)
\ No newline at end of file
+admin.site.register(Chapter, ChapterAdmin)
\ No newline at end of file
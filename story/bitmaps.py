@@ -0,0 +1,201 @@
+"""
+Compressed sets of story ids, after Roaring bitmaps.
+
+Ids are split on their high bits into chunks of 65536. A chunk with few
+ids keeps them as a sorted array of 16 bit values, 2 bytes each; past
+ARRAY_MAX ids it becomes an int used as a 65536 bit set, 8KB at most.
+Set operations go chunk by chunk, and the work within a chunk happens in
+C: & and bit_count() on two bit sets, or indexing a chunk's 0/1 flags
+with the values of an array.
+
+Roaring switches at 4096 ids, where both take the same space. Here an
+& of two bit sets costs about as much as looking up 150 values of an
+array, so chunks switch much earlier and counting stays mostly on bit
+sets, for about twice the memory.
+"""
+import re
+from array import array
+from bisect import insort
+from itertools import compress, groupby
+from operator import itemgetter
+
+CHUNK_BITS = 16
+LOW_MASK = (1 << CHUNK_BITS) - 1
+CHUNK = 1 << CHUNK_BITS
+ARRAY_MAX = 128
+
+ZERO_ONE = bytes.maketrans(b"01", b"\x00\x01")
+ONE_ZERO = bytes.maketrans(b"\x00\x01", b"01")
+ONE = re.compile(b"\x01")
+
+
+def to_bits(lows):
+    flags = bytearray(CHUNK)
+    for low in lows:
+        flags[low] = 1
+    return int(flags[::-1].translate(ONE_ZERO), 2)
+
+
+def to_flags(container):
+    # one byte per value in the chunk, 1 where it's in the set
+    if isinstance(container, int):
+        return bin(container)[:1:-1].ljust(CHUNK, "0").encode().translate(ZERO_ONE)
+    flags = bytearray(CHUNK)
+    for low in container:
+        flags[low] = 1
+    return flags
+
+
+def to_lows(bits):
+    return array("H", (match.start() for match in ONE.finditer(to_flags(bits))))
+
+
+def size(container):
+    return container.bit_count() if isinstance(container, int) else len(container)
+
+
+def fit(container):
+    # the smaller form for a chunk, or None when it's empty
+    if isinstance(container, int):
+        count = container.bit_count()
+        if count > ARRAY_MAX:
+            return container
+        return to_lows(container) if count else None
+    if len(container) > ARRAY_MAX:
+        return to_bits(container)
+    return container or None
+
+
+def intersect(a, b):
+    if isinstance(a, int) and isinstance(b, int):
+        return a & b
+    if isinstance(b, int):
+        a, b = b, a
+    if isinstance(a, int):
+        return array("H", compress(b, map(to_flags(a).__getitem__, b)))
+    return array("H", sorted(set(a).intersection(b)))
+
+
+def union(a, b):
+    if isinstance(a, int) or isinstance(b, int) or len(a) + len(b) > ARRAY_MAX:
+        a = a if isinstance(a, int) else to_bits(a)
+        b = b if isinstance(b, int) else to_bits(b)
+        return a | b
+    return array("H", sorted(set(a).union(b)))
+
+
+class Bitmap:
+    __slots__ = ("containers",)
+
+    def __init__(self, containers=None):
+        self.containers = containers or {}
+
+    @classmethod
+    def from_sorted(cls, ids):
+        containers = {}
+        for high, group in groupby(ids, lambda id: id >> CHUNK_BITS):
+            containers[high] = fit(array("H", (id & LOW_MASK for id in group)))
+        return cls(containers)
+
+    def copy(self):
+        # containers are never changed in place, so they can be shared
+        return Bitmap(dict(self.containers))
+
+    def __len__(self):
+        return sum(size(container) for container in self.containers.values())
+
+    def __bool__(self):
+        return bool(self.containers)
+
+    def __contains__(self, id):
+        container = self.containers.get(id >> CHUNK_BITS)
+        if container is None:
+            return False
+        low = id & LOW_MASK
+        if isinstance(container, int):
+            return bool(container >> low & 1)
+        return low in container
+
+    def __iter__(self):
+        for high in sorted(self.containers):
+            container = self.containers[high]
+            lows = to_lows(container) if isinstance(container, int) else container
+            base = high << CHUNK_BITS
+            for low in lows:
+                yield base | low
+
+    def __eq__(self, other):
+        return isinstance(other, Bitmap) and self.containers == other.containers
+
+    def add(self, id):
+        high, low = id >> CHUNK_BITS, id & LOW_MASK
+        container = self.containers.get(high)
+        if container is None:
+            self.containers[high] = array("H", [low])
+        elif isinstance(container, int):
+            self.containers[high] = container | 1 << low
+        elif low not in container:
+            # containers may be shared with the result of an | or a copy
+            # so are never changed in place
+            container = array("H", container)
+            insort(container, low)
+            self.containers[high] = fit(container)
+
+    def discard(self, id):
+        high, low = id >> CHUNK_BITS, id & LOW_MASK
+        container = self.containers.get(high)
+        if container is None:
+            return
+        if isinstance(container, int):
+            container = fit(container & ~(1 << low))
+        elif low in container:
+            container = array("H", container)
+            container.remove(low)
+            container = fit(container)
+        if container is None:
+            del self.containers[high]
+        else:
+            self.containers[high] = container
+
+    def __and__(self, other):
+        containers = {}
+        for high in self.containers.keys() & other.containers.keys():
+            container = fit(intersect(self.containers[high], other.containers[high]))
+            if container is not None:
+                containers[high] = container
+        return Bitmap(containers)
+
+    def __or__(self, other):
+        containers = dict(self.containers)
+        for high, container in other.containers.items():
+            mine = containers.get(high)
+            containers[high] = container if mine is None else fit(union(mine, container))
+        return Bitmap(containers)
+
+    def intersection_counts(self, bitmaps):
+        """
+        len(self & bitmap) for each of bitmaps, without building the
+        intersections. Each of this set's chunks is turned into a bit set
+        and into flags once, then every chunk of the others is a single
+        & and bit_count() or a sum of flags picked by its values.
+        """
+        bits = {
+            high: container if isinstance(container, int) else to_bits(container)
+            for high, container in self.containers.items()
+        }
+        flags = {}
+        for bitmap in bitmaps:
+            count = 0
+            for high, container in bitmap.containers.items():
+                mine = bits.get(high)
+                if mine is None:
+                    continue
+                if isinstance(container, int):
+                    count += (mine & container).bit_count()
+                elif len(container) == 1:
+                    count += mine >> container[0] & 1
+                else:
+                    if high not in flags:
+                        flags[high] = to_flags(mine)
+                    count += itemgetter(*container)(flags[high]).count(1)
+            yield count
@@ -1,16 +1,23 @@
 from rest_framework import generics
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
+from config.response_cache import CachedResponseMixin
+
+from . import facets
 from .models import Story
+from .pagination import FeedPagination
 from .serializers import StorySerializer
     
-class ByCategoryView(generics.ListAPIView):
+class ByCategoryView(CachedResponseMixin, generics.ListAPIView):
     serializer_class = StorySerializer
+    cache_versions = ("stories", "tags", "categories")
+    pagination_class = FeedPagination
 
     def get_queryset(self):
         category_id = self.kwargs["id"]
         if category_id:
-            queryset = Story.objects.filter(is_published=True).filter(categories__id=category_id).order_by("-created_at")
+            queryset = Story.objects.filter(is_published=True).filter(categories__id=category_id).for_list().order_by("-created_at", "-id")
         else:
             queryset = Story.objects.none()
 
@@ -25,13 +32,15 @@ class ByCategoryView(generics.ListAPIView):
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
     
-class ByTagView(generics.ListAPIView):
+class ByTagView(CachedResponseMixin, generics.ListAPIView):
     serializer_class = StorySerializer
+    cache_versions = ("stories", "tags", "categories")
+    pagination_class = FeedPagination
 
     def get_queryset(self):
         tag_id = self.kwargs["id"]
         if tag_id:
-            queryset = Story.objects.filter(is_published=True).filter(tags__id=tag_id).order_by("-created_at")
+            queryset = Story.objects.filter(is_published=True).filter(tags__id=tag_id).for_list().order_by("-created_at", "-id")
         else:
             queryset = Story.objects.none()
 
@@ -46,13 +55,15 @@ class ByTagView(generics.ListAPIView):
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)           
 
-class ByAuthorView(generics.ListAPIView):
+class ByAuthorView(CachedResponseMixin, generics.ListAPIView):
     serializer_class = StorySerializer
+    cache_versions = ("stories", "tags", "categories")
+    pagination_class = FeedPagination
 
     def get_queryset(self):
         author_id = self.kwargs["id"]
         if author_id:
-            queryset = Story.objects.filter(is_published=True).filter(user__id=author_id).order_by("-created_at")
+            queryset = Story.objects.filter(is_published=True).filter(user__id=author_id).for_list().order_by("-created_at", "-id")
         else:
             queryset = Story.objects.none()
 
@@ -66,3 +77,49 @@ class ByAuthorView(generics.ListAPIView):
             return self.get_paginated_response(serializer.data)
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
+
+
+class BrowseView(CachedResponseMixin, generics.ListAPIView):
+    """
+    Published stories filed under every tag in ?tags= and every category
+    in ?categories= (comma separated ids), newest first, with "facets":
+    how many of them carry each other tag and category. Both come from
+    the in-memory story.facets index; the page itself is read by id when
+    few stories match, and filtered in the database otherwise.
+    """
+
+    serializer_class = StorySerializer
+    cache_versions = ("stories", "tags", "categories")
+    pagination_class = FeedPagination
+    max_selected = 10
+    facet_limit = 50
+    max_ids_in_query = 1000
+
+    def get_ids(self, param):
+        value = self.request.GET.get(param, "")
+        try:
+            ids = sorted({int(id) for id in value.split(",") if id.strip()})
+        except ValueError:
+            raise ValidationError({param: ["Expected comma separated ids."]})
+        if len(ids) > self.max_selected:
+            raise ValidationError({param: [f"At most {self.max_selected} ids."]})
+        return ids
+
+    def get_queryset(self):
+        queryset = Story.objects.filter(is_published=True)
+        if len(self.matching) <= self.max_ids_in_query:
+            return queryset.filter(pk__in=list(self.matching))
+        return queryset.with_all(self.tag_ids, self.category_ids)
+
+    def list(self, request, *args, **kwargs):
+        self.tag_ids = self.get_ids("tags")
+        self.category_ids = self.get_ids("categories")
+        index = facets.get_index()
+        self.matching = index.matching(self.tag_ids, self.category_ids)
+        counts = facets.facet_counts(
+            index, self.matching, self.tag_ids, self.category_ids, limit=self.facet_limit)
+        page = self.paginate_queryset(self.get_queryset().for_list().order_by("-created_at", "-id"))
+        serializer = self.get_serializer(page, many=True)
+        response = self.get_paginated_response(serializer.data)
+        response.data["facets"] = counts
+        return response
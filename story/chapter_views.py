@@ -1,26 +1,80 @@
-from django.db.models import ( 
-    Q, 
-    F 
-)
+import json
+
+from django.core.exceptions import ValidationError as ModelValidationError
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from rest_framework import generics, status
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.utils.encoders import JSONEncoder
 
 from rest_framework.response import Response
 from accounts.permissions import IsAuthor, IsOwnerOrAdmin
-import html
 
+from . import rendering
+from .conditional import chapter_etag, chapter_last_modified, story_chapters_etag
 from .models import Story, Chapter, StoryChapters
 from .serializers import (
     ChapterSerializer,
     ChapterDetailSerializer
 )
     
+@method_decorator(
+    condition(etag_func=chapter_etag, last_modified_func=chapter_last_modified), name="get")
 class ChapterDetailAPIView(generics.RetrieveAPIView):
     lookup_field = "id"
-    queryset = Chapter.objects.all()
+    queryset = Chapter.objects.with_body()
     serializer_class = ChapterDetailSerializer
     permission_classes = []
+
+    def get_object(self):
+        chapter = super().get_object()
+        chapter.navigation = StoryChapters.objects.navigation(chapter.id) or dict.fromkeys(
+            ("story_id", "position", "chapter_count", "prev_chapter", "next_chapter"))
+        return chapter
+
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        # lets clients prefetch the next chapter
+        links = [
+            '<%s>; rel="%s"' % (
+                request.build_absolute_uri(reverse("story:chapter-detail", args=[response.data[field]])), rel)
+            for field, rel in (("prev_chapter", "prev"), ("next_chapter", "next"))
+            if response.data[field] is not None
+        ]
+        if links:
+            response["Link"] = ", ".join(links)
+        return response
     
+@method_decorator(condition(etag_func=story_chapters_etag), name="get")
+class StoryChaptersAPIView(generics.GenericAPIView):
+    """
+    Every chapter of a story, in order, as a JSON array of chapter details.
+    The response is streamed while the chapters are read chunk_size at a
+    time (see StoryChaptersQuerySet.chapters), so memory stays flat however
+    long the story is.
+    """
+    serializer_class = ChapterDetailSerializer
+    permission_classes = []
+    chunk_size = 20
+
+    def get(self, request, *args, **kwargs):
+        story_id = self.kwargs["storyid"]
+        if not Story.objects.filter(id=story_id).exists():
+            raise NotFound("Story does not exist")
+        chapters = StoryChapters.objects.chapters(story_id, self.chunk_size)
+        return StreamingHttpResponse(self.stream(chapters), content_type="application/json")
+
+    def stream(self, chapters):
+        yield "["
+        for index, chapter in enumerate(chapters):
+            if index:
+                yield ","
+            yield json.dumps(self.get_serializer(chapter).data, cls=JSONEncoder, ensure_ascii=False)
+        yield "]"
+
 class ChapterCreateAPIView(generics.CreateAPIView):
     serializer_class = ChapterSerializer
     permission_classes = [IsOwnerOrAdmin]
@@ -28,16 +82,13 @@ class ChapterCreateAPIView(generics.CreateAPIView):
     def create(self, request, *args, **kwargs):
         try:
             data = request.data.copy()
-            pos = data.pop("pos")
+            pos = int(data.pop("pos"))
             story_id = self.kwargs["storyid"]
             story = Story.objects.get(id=story_id)
             serializer = self.get_serializer(data=data)
             if serializer.is_valid():
                 serializer.save(user=self.request.user)
-                StoryChapters.objects.filter(
-                    Q(story=story)
-                    & Q(order__gte=pos)).update(order=F('order')+1)
-                StoryChapters.objects.create(story=story,chapter=serializer.instance,order=pos)
+                StoryChapters.objects.insert(story, serializer.instance, pos)
                 return Response(
                     data=serializer.data, status=status.HTTP_201_CREATED
         )
@@ -45,6 +96,62 @@ class ChapterCreateAPIView(generics.CreateAPIView):
             raise ValidationError("Invalid story id provided.")
         except KeyError:
             raise ValidationError("Story id is missing from URL.")
+        except (TypeError, ValueError):
+            raise ValidationError("Invalid chapter position.")
+
+class ChapterBulkCreateAPIView(generics.CreateAPIView):
+    serializer_class = ChapterSerializer
+    permission_classes = [IsOwnerOrAdmin]
+    max_chapters = 500
+
+    def create(self, request, *args, **kwargs):
+        chapters = request.data.get("chapters")
+        if not isinstance(chapters, list) or not chapters:
+            raise ValidationError("chapters should be a list of chapters.")
+        if len(chapters) > self.max_chapters:
+            raise ValidationError(f"At most {self.max_chapters} chapters can be added at once.")
+        try:
+            pos = request.data.get("pos")
+            pos = None if pos is None else int(pos)
+            story = Story.objects.get(id=self.kwargs["storyid"])
+        except Story.DoesNotExist:
+            raise ValidationError("Invalid story id provided.")
+        except (TypeError, ValueError):
+            raise ValidationError("Invalid chapter position.")
+
+        # all or nothing: any invalid chapter fails the whole batch
+        serializer = self.get_serializer(data=chapters, many=True)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            instances = Chapter.objects.create_many([
+                Chapter(
+                    title=data.get("title", ""),
+                    body=data.get("body", ""),
+                    body_format=data.get("body_format", rendering.TEXT),
+                    user=request.user,
+                )
+                for data in serializer.validated_data
+            ])
+            StoryChapters.objects.insert_many(story, instances, pos)
+        serializer.instance = instances
+        return Response(data=serializer.data, status=status.HTTP_201_CREATED)
+
+class ChapterReorderAPIView(generics.GenericAPIView):
+    permission_classes = [IsOwnerOrAdmin]
+
+    def put(self, request, *args, **kwargs):
+        chapter_ids = request.data.get("chapters")
+        if not isinstance(chapter_ids, list) or not all(isinstance(id, int) for id in chapter_ids):
+            raise ValidationError("chapters should be a list of chapter ids.")
+        try:
+            story = Story.objects.get(id=self.kwargs["storyid"])
+        except Story.DoesNotExist:
+            raise ValidationError("Invalid story id provided.")
+        try:
+            StoryChapters.objects.reorder(story, chapter_ids)
+        except ModelValidationError as ex:
+            raise ValidationError(ex.messages)
+        return Response({"status": "chapters reordered"})
 
 class ChapterSaveAPIView(generics.UpdateAPIView):
     serializer_class = ChapterSerializer
@@ -55,7 +162,6 @@ class ChapterSaveAPIView(generics.UpdateAPIView):
         try:
             chapter = self.queryset.get(id=self.kwargs.get("id"))
             data = request.data.copy()
-            data["body"] = html.escape(data.pop("body"))
             data["title"] = data.pop("title")
             serializer = self.get_serializer(data=data)
 
@@ -64,6 +170,7 @@ class ChapterSaveAPIView(generics.UpdateAPIView):
                 body = serializer.validated_data["body"]
                 chapter.title = title
                 chapter.body = body
+                chapter.body_format = serializer.validated_data.get("body_format", chapter.body_format)
                 chapter.save()
                 return Response({"status": "chapter saved"})
             else:
@@ -85,12 +192,9 @@ class ChapterDeleteAPIView(generics.DestroyAPIView):
         try:
             chapter = self.queryset.get(id=self.kwargs.get("id"))
             storychapter = StoryChapters.objects.get(chapter=chapter)
-            pos = storychapter.order
+            # orders are sparse, the chapters after it don't move
             storychapter.delete()
             chapter.delete()
-            StoryChapters.objects.filter(
-                Q(story=storychapter.story)
-                & Q(order__gt=pos)).update(order=F('order')-1)
         except Chapter.DoesNotExist:
             return Response("Chapter does not exist", status=status.HTTP_404_NOT_FOUND)
         except StoryChapters.DoesNotExist:
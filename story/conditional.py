@@ -0,0 +1,100 @@
+"""
+Validators for conditional GETs on the detail views, for use with
+django.views.decorators.http.condition. Each one is a single small query
+that runs before the serializer, so a repeat reader gets a 304 without
+the payload (or any chapter body) being loaded.
+"""
+import hashlib
+
+from django.db.models import Count, Max, OuterRef, Subquery, Sum
+from django.utils.http import quote_etag
+
+from comment.models import Comment
+
+from .models import Chapter, Story, StoryChapters
+from .rendering import RENDERER_VERSION
+
+
+def aggregate(queryset, field, expression):
+    # one aggregated value of the rows pointing at the outer story
+    return Subquery(
+        queryset.filter(**{field: OuterRef("pk")}).order_by()
+        .values(field).annotate(value=expression).values("value"))
+
+
+def story_state(story_id):
+    """
+    Everything StoryDetailSerializer's output depends on. Chapter order is
+    covered by story.modified_at, which story.signals bump whenever a
+    chapter is added to or removed from the story.
+    """
+    tags = Story.tags.through.objects
+    categories = Story.categories.through.objects
+    return (
+        Story.objects.filter(pk=story_id)
+        .annotate(
+            chapter_count=aggregate(StoryChapters.objects, "story", Count("pk")),
+            chapters_modified=aggregate(StoryChapters.objects, "story", Max("chapter__modified_at")),
+            comment_count=aggregate(Comment.objects, "story", Count("pk")),
+            comments_modified=aggregate(Comment.objects, "story", Max("modified_at")),
+            tags_modified=aggregate(tags, "story", Max("tag__modified_at")),
+            tags_story_count=aggregate(tags, "story", Sum("tag__story_count")),
+            categories_modified=aggregate(categories, "story", Max("category__modified_at")),
+            categories_story_count=aggregate(categories, "story", Sum("category__story_count")),
+        )
+        .values_list(
+            "modified_at", "user__alias", "chapter_count", "chapters_modified",
+            "comment_count", "comments_modified", "tags_modified", "tags_story_count",
+            "categories_modified", "categories_story_count",
+        )
+        .first()
+    )
+
+
+def story_etag(request, id, **kwargs):
+    # No Last-Modified for stories: a deleted comment or tag changes the
+    # payload without leaving a newer timestamp behind.
+    state = story_state(id)
+    if state is None:
+        return None
+    return quote_etag(hashlib.sha1(repr((id, state)).encode()).hexdigest())
+
+
+def story_chapters_etag(request, storyid, **kwargs):
+    # the story's chapters, their order (story.modified_at) and renderer
+    state = (
+        Story.objects.filter(pk=storyid)
+        .annotate(
+            chapter_count=aggregate(StoryChapters.objects, "story", Count("pk")),
+            chapters_modified=aggregate(StoryChapters.objects, "story", Max("chapter__modified_at")),
+        )
+        .values_list("modified_at", "chapter_count", "chapters_modified")
+        .first()
+    )
+    if state is None:
+        return None
+    return quote_etag(hashlib.sha1(repr((storyid, state, RENDERER_VERSION)).encode()).hexdigest())
+
+
+def chapter_modified_at(request, id):
+    # Shared by the ETag and Last-Modified functions, which condition()
+    # calls one after the other. The story's modified_at covers the
+    # chapter's neighbours, which change when chapters are added, removed
+    # or reordered.
+    if not hasattr(request, "_chapter_modified_at"):
+        row = Chapter.objects.filter(pk=id).values_list(
+            "modified_at", "storychapters__story__modified_at").first()
+        request._chapter_modified_at = row and max(filter(None, row))
+    return request._chapter_modified_at
+
+
+def chapter_etag(request, id, **kwargs):
+    modified_at = chapter_modified_at(request, id)
+    if modified_at is None:
+        return None
+    # a new renderer changes the rendered body without touching the chapter
+    return quote_etag(f"{id}-{modified_at.timestamp()}-{RENDERER_VERSION}")
+
+
+def chapter_last_modified(request, id, **kwargs):
+    return chapter_modified_at(request, id)
@@ -0,0 +1,231 @@
+"""
+Whole-story downloads as EPUB or plain text.
+
+A download is generated while it is sent: chapters are read CHUNK_SIZE
+at a time, each chunk a query of its own (see
+StoryChaptersQuerySet.chapters), and written out before the next is
+read, so neither the story nor the archive is ever held in memory. What is sent is
+also saved under EXPORT_ROOT, named after the story's latest change, so
+later downloads of an unchanged story are plain file serving. A change
+gives the story a new name, and the old file is removed once the new one
+is complete.
+"""
+import html
+import io
+import os
+import tempfile
+import zipfile
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Max
+from django.http import FileResponse, StreamingHttpResponse
+
+from .models import Chapter, ChapterContent, StoryChapters
+from .rendering import MARKDOWN, RENDERER_VERSION
+
+CONTENT_TYPES = {
+    "epub": "application/epub+zip",
+    "txt": "text/plain; charset=utf-8",
+}
+CHUNK_SIZE = 20
+
+CONTAINER = """<?xml version="1.0" encoding="UTF-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles>
+    <rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>
+  </rootfiles>
+</container>
+"""
+
+XHTML = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">
+<head><title>{title}</title></head>
+<body>
+{body}
+</body>
+</html>
+"""
+
+PACKAGE = """<?xml version="1.0" encoding="UTF-8"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="story-id">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+    <dc:identifier id="story-id">urn:brawna:story:{id}</dc:identifier>
+    <dc:title>{title}</dc:title>
+    <dc:creator>{author}</dc:creator>
+    <dc:language>en</dc:language>
+    <meta property="dcterms:modified">{modified}</meta>
+  </metadata>
+  <manifest>
+    <item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>
+{items}
+  </manifest>
+  <spine>
+{itemrefs}
+  </spine>
+</package>
+"""
+
+
+class StreamBuffer(io.RawIOBase):
+    """
+    File object for zipfile that hands out what has been written so far.
+    It can only seek within what hasn't been taken yet, which is all
+    zipfile needs to go back and fill in the header of the entry it just
+    wrote, as long as take() is called between entries.
+    """
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+        self.offset = 0
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.offset + self.buffer.tell()
+
+    def seek(self, position, whence=io.SEEK_SET):
+        if whence != io.SEEK_SET or position < self.offset:
+            raise io.UnsupportedOperation("can't seek into data already sent")
+        return self.offset + self.buffer.seek(position - self.offset)
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+    def take(self):
+        data = self.buffer.getvalue()
+        self.offset += len(data)
+        self.buffer = io.BytesIO()
+        return data
+
+
+def export_stamp(story):
+    # the latest change to the story or any of its chapters
+    latest = Chapter.objects.filter(storychapters__story=story).aggregate(
+        latest=Max("modified_at"))["latest"]
+    return max(filter(None, [story.modified_at, latest]))
+
+
+def export_path(story, format, stamp):
+    stamp = int(stamp.timestamp() * 1000000)
+    return Path(settings.EXPORT_ROOT) / f"story-{story.id}-{stamp}-r{RENDERER_VERSION}.{format}"
+
+
+def chapter_text(chapter):
+    try:
+        return chapter.content.plain_text
+    except ChapterContent.DoesNotExist:
+        return ""
+
+
+def chapter_html(chapter):
+    if chapter.body_format == MARKDOWN:
+        try:
+            return chapter.content.get_rendered()
+        except ChapterContent.DoesNotExist:
+            return ""
+    # the stored HTML of a text chapter may be imported markup that isn't
+    # valid XHTML, so build it again from the plain text
+    paragraphs = [p.strip() for p in chapter_text(chapter).split("\n\n") if p.strip()]
+    return "\n".join(
+        "<p>%s</p>" % "<br/>".join(html.escape(line) for line in paragraph.split("\n"))
+        for paragraph in paragraphs
+    )
+
+
+def txt_chunks(story, chapters, stamp):
+    header = f"{story.title}\nby {story.user.alias}\n"
+    if story.brief:
+        header += f"\n{story.brief}\n"
+    yield header.encode()
+    for chapter in chapters:
+        yield f"\n\n{chapter.title}\n\n{chapter_text(chapter)}\n".encode()
+
+
+def epub_chunks(story, chapters, stamp):
+    buffer = StreamBuffer()
+    toc = []
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as epub:
+        # has to come first, uncompressed
+        epub.writestr("mimetype", CONTENT_TYPES["epub"], compress_type=zipfile.ZIP_STORED)
+        epub.writestr("META-INF/container.xml", CONTAINER)
+        yield buffer.take()
+        for index, chapter in enumerate(chapters, 1):
+            name = f"chapter-{index}.xhtml"
+            title = html.escape(chapter.title or f"Chapter {index}")
+            epub.writestr(
+                f"OEBPS/{name}",
+                XHTML.format(title=title, body=f"<h2>{title}</h2>\n{chapter_html(chapter)}"),
+            )
+            toc.append((name, title))
+            yield buffer.take()
+        links = "\n".join(f'<li><a href="{name}">{title}</a></li>' for name, title in toc)
+        epub.writestr("OEBPS/nav.xhtml", XHTML.format(
+            title=html.escape(story.title),
+            body=f'<nav epub:type="toc"><h1>{html.escape(story.title)}</h1><ol>\n{links}\n</ol></nav>',
+        ))
+        epub.writestr("OEBPS/content.opf", PACKAGE.format(
+            id=story.id,
+            title=html.escape(story.title),
+            author=html.escape(story.user.alias or ""),
+            modified=stamp.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            items="\n".join(
+                f'    <item id="c{i}" href="{name}" media-type="application/xhtml+xml"/>'
+                for i, (name, _) in enumerate(toc, 1)
+            ),
+            itemrefs="\n".join(f'    <itemref idref="c{i}"/>' for i in range(1, len(toc) + 1)),
+        ))
+    yield buffer.take()
+
+
+BUILDERS = {
+    "epub": epub_chunks,
+    "txt": txt_chunks,
+}
+
+
+def save_while_streaming(path, chunks, replaces):
+    """
+    Pass chunks through, writing them to path as well. The file only
+    appears once complete, and then the files matching the replaces glob
+    are removed.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, partial = tempfile.mkstemp(dir=path.parent, prefix=".partial-")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            for chunk in chunks:
+                file.write(chunk)
+                yield chunk
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            # the download was abandoned or failed
+            os.unlink(partial)
+    for old in path.parent.glob(replaces):
+        if old != path:
+            old.unlink(missing_ok=True)
+
+
+def export_response(story, format):
+    stamp = export_stamp(story)
+    path = export_path(story, format, stamp)
+    filename = f"{story.slug}.{format}"
+    try:
+        return FileResponse(
+            open(path, "rb"), as_attachment=True, filename=filename,
+            content_type=CONTENT_TYPES[format])
+    except FileNotFoundError:
+        pass
+    chapters = StoryChapters.objects.chapters(story.id, CHUNK_SIZE)
+    response = StreamingHttpResponse(
+        save_while_streaming(
+            path, BUILDERS[format](story, chapters, stamp), f"story-{story.id}-*.{format}"),
+        content_type=CONTENT_TYPES[format])
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
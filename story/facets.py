@@ -0,0 +1,160 @@
+"""
+Tag and category membership of stories as bitmaps (story.bitmaps), for
+browsing by several of them at once and counting the rest in memory.
+
+The index has one bitmap of published story ids and one of story ids
+per tag and per category, drafts included, so publishing a story only
+touches the first. It is a story.local_index.LocalIndex, loaded from the
+m2m tables in (story_id, ...) order, which their unique indexes give
+without sorting, and kept current by the receivers in story.signals.
+"""
+import heapq
+from array import array
+
+from category.models import Category
+from tag.models import Tag
+
+from .bitmaps import Bitmap
+from .local_index import LocalIndex
+from .models import Story
+
+FACETS = {
+    "tags": ("tag_id", Tag),
+    "categories": ("category_id", Category),
+}
+
+
+class FacetIndex:
+    def __init__(self, published, facets):
+        self.published = published
+        self.facets = facets
+        # counts over all published stories; a change makes a copy without them
+        self.kept = {}
+
+    def copy(self):
+        # for LocalIndex.changed; bitmaps are copied as they change, see bitmap()
+        return FacetIndex(
+            self.published.copy(), {facet: dict(bitmaps) for facet, bitmaps in self.facets.items()})
+
+    def bitmap(self, facet, id):
+        # the option's bitmap to change, a copy of the one still being read
+        bitmap = self.facets[facet].get(id)
+        bitmap = bitmap.copy() if bitmap is not None else Bitmap()
+        self.facets[facet][id] = bitmap
+        return bitmap
+
+    def matching(self, tag_ids=(), category_ids=()):
+        bitmaps = [self.published]
+        bitmaps += [self.facets["tags"].get(id, Bitmap()) for id in tag_ids]
+        bitmaps += [self.facets["categories"].get(id, Bitmap()) for id in category_ids]
+        # smallest first, so every step is at most that size
+        bitmaps.sort(key=len)
+        stories = bitmaps[0]
+        for bitmap in bitmaps[1:]:
+            if not stories:
+                break
+            stories = stories & bitmap
+        return stories
+
+    def counts(self, stories, facet, exclude=(), limit=None):
+        # (id, count) of the facet's options among stories, most first
+        if stories is self.published and not exclude:
+            if (facet, limit) not in self.kept:
+                self.kept[facet, limit] = self.count(stories, facet, exclude, limit)
+            return self.kept[facet, limit]
+        return self.count(stories, facet, exclude, limit)
+
+    def count(self, stories, facet, exclude, limit):
+        bitmaps = {id: bitmap for id, bitmap in self.facets[facet].items() if id not in exclude}
+        counts = [
+            (count, id)
+            for id, count in zip(bitmaps, stories.intersection_counts(bitmaps.values()))
+            if count
+        ]
+        key = lambda pair: (-pair[0], pair[1])
+        counts = heapq.nsmallest(limit, counts, key=key) if limit else sorted(counts, key=key)
+        return [(id, count) for count, id in counts]
+
+
+def load():
+    published = Bitmap.from_sorted(
+        Story.objects.filter(is_published=True).order_by("id")
+        .values_list("id", flat=True).iterator(chunk_size=10000))
+    facets = {}
+    for facet, (column, _) in FACETS.items():
+        through = getattr(Story, facet).through
+        story_ids = {}
+        rows = through.objects.order_by("story_id", column).values_list(column, "story_id")
+        for id, story_id in rows.iterator(chunk_size=10000):
+            if id not in story_ids:
+                story_ids[id] = array("Q")
+            story_ids[id].append(story_id)
+        facets[facet] = {id: Bitmap.from_sorted(ids) for id, ids in story_ids.items()}
+    return FacetIndex(published, facets)
+
+
+local = LocalIndex("facets", load)
+
+
+def get_index():
+    return local.get()
+
+
+def facet_counts(index, stories, exclude_tags=(), exclude_categories=(), limit=None):
+    """
+    How many of stories each tag and category has, most first, as
+    {"tags": [{"id", "name", "count"}], "categories": [...]}. Only the
+    names come from the database, one query per facet.
+    """
+    result = {}
+    for facet, exclude in (("tags", exclude_tags), ("categories", exclude_categories)):
+        counts = index.counts(stories, facet, set(exclude), limit)
+        model = FACETS[facet][1]
+        names = dict(model.objects.filter(id__in=[id for id, _ in counts]).values_list("id", "name"))
+        result[facet] = [
+            {"id": id, "name": names[id], "count": count} for id, count in counts if id in names
+        ]
+    return result
+
+
+def story_saved(story):
+    def update(index):
+        if story.is_published:
+            index.published.add(story.pk)
+        else:
+            index.published.discard(story.pk)
+    local.changed(update)
+
+
+def story_deleted(story_id, tag_ids, category_ids):
+    def update(index):
+        index.published.discard(story_id)
+        for id in tag_ids:
+            index.bitmap("tags", id).discard(story_id)
+        for id in category_ids:
+            index.bitmap("categories", id).discard(story_id)
+    local.changed(update)
+
+
+def memberships_changed(facet, instance, action, reverse, pk_set, ids):
+    # ids are the affected tags or categories, see story.signals.affected_ids
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    change = Bitmap.add if action == "post_add" else Bitmap.discard
+
+    def update(index):
+        if reverse and action == "post_clear":
+            index.facets[facet][instance.pk] = Bitmap()
+        elif reverse:
+            bitmap = index.bitmap(facet, instance.pk)
+            for story_id in pk_set:
+                change(bitmap, story_id)
+        else:
+            for id in ids:
+                change(index.bitmap(facet, id), instance.pk)
+    local.changed(update)
+
+
+def option_deleted(facet, id):
+    local.changed(lambda index: index.facets[facet].pop(id, None))
@@ -0,0 +1,135 @@
+"""
+In-memory indexes held by every process, such as story.typeahead.
+
+An index is built on first use (config.wsgi builds them when a worker
+starts) and the signal receivers in story.signals apply changes to it
+through changed(), once the change is committed: a rolled back one
+never reaches the index. Requests read the index without locking, so
+it is never changed in place: changed() applies the update to
+index.copy() and swaps the copy in. Each change also bumps a shared
+cache version named after the index. A process that sees the version moved by someone else
+rebuilds its copy, at most once every REBUILD_AFTER seconds. When the
+cache is local to each process it never sees that, so it rebuilds every
+REBUILD_AFTER seconds instead.
+
+Rebuilding takes seconds for a large catalogue, so it happens in a
+thread while requests go on with the index they have. Changes made
+meanwhile are applied to both, and the new index replaces the old one
+when it is done.
+"""
+import threading
+import time
+
+from django.db import connection, transaction
+
+from config.response_cache import get_versions, incr_versions, is_shared
+
+REBUILD_AFTER = 60
+
+
+class LocalIndex:
+    # off where a rebuild has to be seen by the request that starts it
+    background = True
+
+    def __init__(self, name, build):
+        self.name = name
+        self.build = build
+        self.index = None
+        self.version = None
+        self.built_at = None
+        self.lock = threading.Lock()
+        # held for the whole of a build, so there's one at a time
+        self.building = threading.Lock()
+        # changes made during a build, to apply to its index
+        self.pending = None
+        self.rebuilder = None
+
+    def shared_version(self):
+        return get_versions([self.name])[0]
+
+    def is_stale(self):
+        return time.monotonic() - self.built_at >= REBUILD_AFTER and (
+            not is_shared() or self.version != self.shared_version())
+
+    def get(self):
+        index = self.index
+        if index is None:
+            # nothing to serve meanwhile, so wait for it
+            with self.building:
+                if self.index is None:
+                    self.rebuild()
+            return self.index
+        if self.is_stale() and self.building.acquire(blocking=False):
+            if self.background:
+                self.rebuilder = threading.Thread(
+                    target=self.refresh_in_background, name=f"rebuild {self.name} index", daemon=True)
+                self.rebuilder.start()
+            else:
+                self.refresh()
+                index = self.index
+        return index
+
+    def rebuild(self):
+        # the version from before the build, which may miss later changes
+        version = self.shared_version()
+        with self.lock:
+            self.pending = []
+        try:
+            index = self.build()
+        except BaseException:
+            with self.lock:
+                self.pending = None
+            raise
+        with self.lock:
+            for update in self.pending:
+                update(index)
+            self.pending = None
+            self.index = index
+            self.version = version
+            self.built_at = time.monotonic()
+
+    def refresh(self):
+        # with self.building acquired by get()
+        try:
+            self.rebuild()
+        except Exception:
+            # tried again after the usual wait rather than on every request
+            self.built_at = time.monotonic()
+            raise
+        finally:
+            self.building.release()
+
+    def refresh_in_background(self):
+        try:
+            self.refresh()
+        finally:
+            # the thread's own database connection
+            connection.close()
+
+    def reset(self):
+        with self.lock:
+            self.index = None
+
+    @property
+    def built(self):
+        return self.index is not None
+
+    def changed(self, update):
+        # Applied to this process's index if it has one; others rebuild.
+        transaction.on_commit(lambda: self.apply(update))
+
+    def apply(self, update):
+        with self.lock:
+            if self.pending is not None:
+                self.pending.append(update)
+            if self.index is None:
+                return
+            index = self.index.copy()
+            update(index)
+            self.index = index
+            before = self.version
+            incr_versions([self.name])
+            after = self.shared_version()
+            if before is not None and after == before + 1:
+                # nobody else changed anything in between
+                self.version = after
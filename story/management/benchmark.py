@@ -0,0 +1,55 @@
+"""
+Shared by the bench_* commands: timing an action over many inputs,
+reporting the spread, and writing made-up data inside a transaction that
+is rolled back at the end.
+"""
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+
+class Rollback(Exception):
+    pass
+
+
+class BenchmarkCommand(BaseCommand):
+    # run() in a transaction that is rolled back, for benchmarks that write
+    rollback = False
+    # what report() counts, and the decimals of its timings
+    unit = "queries"
+    precision = 1
+
+    def handle(self, *args, **options):
+        if not self.rollback:
+            self.run(options)
+            return
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def run(self, options):
+        raise NotImplementedError
+
+    def time_each(self, items, action):
+        # milliseconds action(item) took, for each of items
+        timings = []
+        for item in items:
+            started = time.perf_counter()
+            action(item)
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+    def report(self, name, timings):
+        timings = sorted(timings)
+        digits = self.precision
+        self.stdout.write(
+            f"{name}: median {statistics.median(timings):.{digits}f}ms, "
+            f"mean {statistics.mean(timings):.{digits}f}ms, "
+            f"p99 {timings[int(len(timings) * 0.99)]:.{digits}f}ms, "
+            f"max {timings[-1]:.{digits}f}ms over {len(timings)} {self.unit}"
+        )
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from story.models import Story
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the stored excerpt of every story from its first chapter "
+        "(or only of stories without one with --missing)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--missing", action="store_true")
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        stories = Story.objects.all()
+        if options["missing"]:
+            stories = stories.filter(excerpt="")
+        last_id = 0
+        total = 0
+        while True:
+            ids = list(
+                stories.filter(id__gt=last_id)
+                .order_by("id")
+                .values_list("id", flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            total += Story.objects.filter(id__in=ids).refresh_excerpts()
+            last_id = ids[-1]
+            self.stdout.write(f"\r{total} stories processed", ending="")
+        self.stdout.write(f"\r{total} stories processed")
@@ -0,0 +1,87 @@
+import random
+import time
+import tracemalloc
+from array import array
+
+from story.bitmaps import Bitmap
+from story.facets import FacetIndex
+from story.management.benchmark import BenchmarkCommand
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Build the tag and category bitmaps for made-up catalogues of "
+        "several sizes and report their memory use, build time and how "
+        "long browsing and facet counts take. Nothing touches the database; "
+        "bench_facets times loading the index from it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--stories", type=int, nargs="+", default=[10000, 100000, 1000000])
+        parser.add_argument("--tags", type=int, default=2000)
+        parser.add_argument("--categories", type=int, default=30)
+        parser.add_argument("--queries", type=int, default=50)
+        parser.add_argument("--seed", type=int, default=1)
+
+    def run(self, options):
+        for stories in options["stories"]:
+            self.measure(stories, options)
+
+    def measure(self, stories, options):
+        rng = random.Random(options["seed"])
+        # a few tags are on many stories and most are on a few
+        tag_weights = [1 / (rank + 1) for rank in range(options["tags"])]
+        category_weights = [1 / (rank + 1) for rank in range(options["categories"])]
+        published = array("Q")
+        rows = {"tags": {}, "categories": {}}
+        memberships = 0
+        for story_id in range(1, stories + 1):
+            if rng.random() < 0.9:
+                published.append(story_id)
+            for facet, weights, count in (
+                ("tags", tag_weights, rng.randint(3, 8)),
+                ("categories", category_weights, rng.randint(1, 2)),
+            ):
+                for id in set(rng.choices(range(len(weights)), weights, k=count)):
+                    rows[facet].setdefault(id, array("Q")).append(story_id)
+                    memberships += 1
+
+        def build():
+            return FacetIndex(
+                Bitmap.from_sorted(published),
+                {facet: {id: Bitmap.from_sorted(ids) for id, ids in ids_by_option.items()}
+                 for facet, ids_by_option in rows.items()},
+            )
+
+        started = time.perf_counter()
+        index = build()
+        built = time.perf_counter() - started
+        # once more to measure it, tracing slows building down
+        tracemalloc.start()
+        traced = build()
+        size, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del traced
+        self.stdout.write(
+            f"\n{stories} stories, {memberships} memberships: built in {built * 1000:.0f}ms, "
+            f"{size / 2 ** 20:.1f}MB ({peak / 2 ** 20:.1f}MB peak), "
+            f"{size / memberships:.1f} bytes a membership"
+        )
+
+        selections = []
+        for _ in range(options["queries"]):
+            # mostly popular tags, as readers would pick them from the facets
+            tag_ids = set(rng.choices(range(50), k=rng.randint(1, 3)))
+            category_ids = {rng.randrange(options["categories"])} if rng.random() < 0.5 else set()
+            selections.append((tag_ids, category_ids))
+        self.report("matching", self.time_each(
+            selections, lambda selection: index.matching(*selection)))
+        self.report("matching and facet counts", self.time_each(selections, lambda selection: [
+            index.counts(matching, facet, exclude, 50)
+            for matching in [index.matching(*selection)]
+            for facet, exclude in zip(("tags", "categories"), selection)
+        ]))
+        # these are kept by the index until something changes
+        self.report("facet counts, nothing selected", self.time_each(selections[:5], lambda _: [
+            index.count(index.published, facet, (), 50) for facet in ("tags", "categories")
+        ]))
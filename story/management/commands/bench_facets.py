@@ -0,0 +1,110 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count
+
+from category.models import Category
+from story import facets
+from story.management.benchmark import BenchmarkCommand
+from story.models import Story
+from tag.models import Tag
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Time faceted browsing (stories with all of some tags and "
+        "categories, and the counts of the other options) over a made-up "
+        "catalogue, in the database and with the in-memory index, and print "
+        "the query plans. Everything is written inside a transaction that is "
+        "rolled back at the end."
+    )
+
+    rollback = True
+
+    def add_arguments(self, parser):
+        parser.add_argument("--stories", type=int, default=100000)
+        parser.add_argument("--tags", type=int, default=2000)
+        parser.add_argument("--categories", type=int, default=30)
+        parser.add_argument("--queries", type=int, default=50)
+        parser.add_argument("--seed", type=int, default=1)
+
+    def run(self, options):
+        rng = random.Random(options["seed"])
+        user = get_user_model().objects.create(
+            username="bench-facets", alias="bench-facets", email="bench-facets@example.com")
+        tags = Tag.objects.bulk_create(
+            Tag(name=f"bench tag {i}", name_normalized=f"bench tag {i}")
+            for i in range(options["tags"]))
+        categories = Category.objects.bulk_create(
+            Category(name=f"bench category {i}") for i in range(options["categories"]))
+        # a few tags are on many stories and most are on a few
+        tag_weights = [1 / (rank + 1) for rank in range(len(tags))]
+        category_weights = [1 / (rank + 1) for rank in range(len(categories))]
+
+        started = time.perf_counter()
+        stories = Story.objects.bulk_create(
+            (Story(title=f"story {i}", slug=f"bench-facets-{i}", user=user,
+                   is_published=rng.random() < 0.9)
+             for i in range(options["stories"])),
+            batch_size=2000,
+        )
+        story_tags, story_categories = [], []
+        for story in stories:
+            for tag in set(rng.choices(tags, tag_weights, k=rng.randint(3, 8))):
+                story_tags.append(Story.tags.through(story_id=story.id, tag_id=tag.id))
+            for category in set(rng.choices(categories, category_weights, k=rng.randint(1, 2))):
+                story_categories.append(
+                    Story.categories.through(story_id=story.id, category_id=category.id))
+        Story.tags.through.objects.bulk_create(story_tags, batch_size=5000)
+        Story.categories.through.objects.bulk_create(story_categories, batch_size=5000)
+        self.stdout.write(
+            f"catalogue: {len(stories)} stories, {len(story_tags)} story tags, "
+            f"{len(story_categories)} story categories, "
+            f"written in {time.perf_counter() - started:.1f}s"
+        )
+
+        selections = []
+        for _ in range(options["queries"]):
+            # mostly popular tags, as readers would pick them from the facets
+            tag_ids = {tag.id for tag in rng.choices(tags[:50], k=rng.randint(1, 3))}
+            category_ids = {rng.choice(categories).id} if rng.random() < 0.5 else set()
+            selections.append((tag_ids, category_ids))
+
+        published = Story.objects.filter(is_published=True)
+        self.report("stories, first page", self.time_each(selections, lambda selection: list(
+            published.with_all(*selection).order_by("-created_at", "-id").values("id")[:20])))
+        self.report("stories, count", self.time_each(selections, lambda selection: (
+            published.with_all(*selection).count())))
+        self.report("facet counts, database", self.time_each(selections, lambda selection: (
+            self.count_in_database(published.with_all(*selection), *selection))))
+
+        started = time.perf_counter()
+        index = facets.load()
+        self.stdout.write(f"index: loaded in {(time.perf_counter() - started) * 1000:.0f}ms")
+        self.report("matching and facet counts, index", self.time_each(selections, lambda selection: [
+            index.counts(matching, facet, exclude, 50)
+            for matching in [index.matching(*selection)]
+            for facet, exclude in zip(("tags", "categories"), selection)
+        ]))
+
+        tag_ids, category_ids = selections[0]
+        matching = published.with_all(tag_ids, category_ids)
+        self.stdout.write("\nplan, stories:")
+        self.stdout.write(matching.order_by("-created_at", "-id").values("id")[:20].explain())
+        through = Story.tags.through.objects.filter(story_id__in=matching.order_by().values("pk"))
+        self.stdout.write("\nplan, tag counts:")
+        self.stdout.write(through.values("tag_id").annotate(count=Count("story_id")).explain())
+
+    def count_in_database(self, stories, tag_ids, category_ids):
+        # what the index does, as a GROUP BY over the m2m tables
+        for through, column, exclude in (
+            (Story.tags.through, "tag_id", tag_ids),
+            (Story.categories.through, "category_id", category_ids),
+        ):
+            list(
+                through.objects.filter(story_id__in=stories.order_by().values("pk"))
+                .exclude(**{f"{column}__in": exclude})
+                .values_list(column).annotate(count=Count("story_id"))
+                .order_by("-count", column)[:50]
+            )
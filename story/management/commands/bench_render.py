@@ -0,0 +1,67 @@
+import random
+import statistics
+
+from django.contrib.auth import get_user_model
+
+from story.management.benchmark import BenchmarkCommand
+from story.models import Chapter, ChapterContent
+from story.rendering import MARKDOWN
+from story.serializers import ChapterDetailSerializer
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Time serving Markdown chapters from the HTML stored at save time "
+        "against rendering them on every read, and what rendering adds to a "
+        "save. Everything is written inside a transaction that is rolled "
+        "back at the end."
+    )
+
+    rollback = True
+    unit = "chapters"
+    precision = 2
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chapters", type=int, default=200)
+        parser.add_argument("--paragraphs", type=int, default=40)
+        parser.add_argument("--seed", type=int, default=1)
+
+    def run(self, options):
+        rng = random.Random(options["seed"])
+        user = get_user_model().objects.create(
+            username="bench-render", alias="bench-render", email="bench-render@example.com")
+        bodies = [self.make_body(rng, options["paragraphs"]) for _ in range(options["chapters"])]
+        self.stdout.write(
+            f"corpus: {len(bodies)} chapters, "
+            f"{statistics.mean(len(body) for body in bodies) / 1000:.1f}KB of Markdown each"
+        )
+
+        plain = [Chapter(title="chapter", body=body, user=user) for body in bodies]
+        self.report("save, plain text", self.time_each(plain, lambda chapter: chapter.save()))
+        markdown = [Chapter(title="chapter", body=body, body_format=MARKDOWN, user=user) for body in bodies]
+        self.report("save, Markdown", self.time_each(markdown, lambda chapter: chapter.save()))
+
+        ids = [chapter.id for chapter in markdown]
+        self.report("read, stored HTML", self.time_each(ids, self.read))
+        # stale rows are rendered on the read path instead
+        ChapterContent.objects.filter(chapter_id__in=ids).update(renderer_version=0)
+        self.report("read, rendered per request", self.time_each(ids, self.read))
+
+    def make_body(self, rng, paragraphs):
+        words = ["lorem", "ipsum", "dolor", "sit", "amet", "*consectetur*", "**adipiscing**",
+                 "`elit`", "[sed](https://example.com/)", "do", "eiusmod", "tempor"]
+        blocks = []
+        for i in range(paragraphs):
+            text = " ".join(rng.choices(words, k=rng.randint(40, 120)))
+            if i % 10 == 0:
+                blocks.append(f"## Part {i // 10 + 1}")
+            elif i % 7 == 0:
+                text = "\n".join(f"- {item}" for item in text.split(" ")[:5])
+            elif i % 5 == 0:
+                text = "> " + text
+            blocks.append(text)
+        return "\n\n".join(blocks)
+
+    def read(self, chapter_id):
+        chapter = Chapter.objects.with_body().get(id=chapter_id)
+        return ChapterDetailSerializer(chapter).data
@@ -0,0 +1,101 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+
+from story.management.benchmark import BenchmarkCommand
+from story.models import Chapter, Story, StoryChapters
+from story.search_backends import get_search_backend, index_stories
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Compare the legacy chapter-join icontains search with the full-text "
+        "backend on a synthetic corpus. Everything is written inside a "
+        "transaction that is rolled back at the end."
+    )
+
+    rollback = True
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chapters", type=int, default=50000)
+        parser.add_argument("--chapters-per-story", type=int, default=10)
+        parser.add_argument("--words-per-chapter", type=int, default=200)
+        parser.add_argument("--queries", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=1)
+
+    def run(self, options):
+        rng = random.Random(options["seed"])
+        vocabulary = [self.make_word(rng) for _ in range(5000)]
+
+        started = time.perf_counter()
+        story_ids = self.build_corpus(rng, vocabulary, options)
+        self.stdout.write(
+            f"corpus: {options['chapters']} chapters in {len(story_ids)} stories, "
+            f"built in {time.perf_counter() - started:.1f}s"
+        )
+
+        started = time.perf_counter()
+        for i in range(0, len(story_ids), 500):
+            index_stories(story_ids[i:i + 500])
+        self.stdout.write(f"index: built in {time.perf_counter() - started:.1f}s")
+
+        queries = rng.sample(vocabulary, options["queries"])
+        backend = get_search_backend()
+        published = Story.objects.filter(is_published=True)
+
+        def legacy(q):
+            return published.filter(
+                Q(chapters__content__body__icontains=q)
+                | Q(user__alias__icontains=q)
+                | Q(brief__icontains=q)
+                | Q(title__icontains=q)
+            ).distinct().order_by("title")
+
+        def full_text(q):
+            return backend.search(published, q).order_by("-search_rank", "title")
+
+        for name, search in (("legacy icontains", legacy), (type(backend).__name__, full_text)):
+            self.report(name, self.time_each(queries, lambda q: self.fetch(search(q))))
+
+    def make_word(self, rng):
+        return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(4, 9)))
+
+    def build_corpus(self, rng, vocabulary, options):
+        user = get_user_model().objects.create(
+            username="bench-search", alias="bench-search", email="bench-search@example.com")
+        per_story = options["chapters_per_story"]
+        story_count = -(-options["chapters"] // per_story)
+        Story.objects.bulk_create([
+            Story(
+                title=" ".join(rng.choices(vocabulary, k=3)),
+                brief=" ".join(rng.choices(vocabulary, k=20)),
+                slug=f"bench-search-{i}",
+                user=user,
+                is_published=True,
+            )
+            for i in range(story_count)
+        ], batch_size=1000)
+        stories = list(Story.objects.filter(user=user).order_by("id"))
+        for offset in range(0, options["chapters"], 5000):
+            count = min(5000, options["chapters"] - offset)
+            bodies = [
+                " ".join(rng.choices(vocabulary, k=options["words_per_chapter"]))
+                for _ in range(count)
+            ]
+            Chapter.objects.create_many([
+                Chapter(title=f"chapter {offset + i}", body=body, user=user)
+                for i, body in enumerate(bodies)
+            ])
+        chapters = Chapter.objects.filter(user=user).order_by("id").values_list("id", flat=True)
+        StoryChapters.objects.bulk_create([
+            StoryChapters(story=stories[i // per_story], chapter_id=chapter_id, order=i % per_story)
+            for i, chapter_id in enumerate(chapters.iterator())
+        ], batch_size=1000)
+        return [story.id for story in stories]
+
+    def fetch(self, queryset):
+        # what a search page needs: the count and the first page
+        queryset.count()
+        list(queryset[:12])
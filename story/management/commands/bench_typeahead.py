@@ -0,0 +1,56 @@
+import random
+import time
+import tracemalloc
+
+from story.management.benchmark import BenchmarkCommand
+from story.typeahead import KINDS, Entry, PrefixIndex
+from tag.models import normalize_name
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Build the typeahead index over a made-up vocabulary of tags, "
+        "authors and titles and report its memory use and how long "
+        "suggestions and updates take. Nothing touches the database."
+    )
+
+    unit = "calls"
+    precision = 3
+
+    def add_arguments(self, parser):
+        parser.add_argument("--entries", type=int, default=100000)
+        parser.add_argument("--queries", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=1)
+
+    def run(self, options):
+        rng = random.Random(options["seed"])
+        syllables = ["ka", "lo", "mi", "ra", "sen", "tor", "vel", "dun", "ash", "bri", "cor", "e", "ith"]
+        words = ["".join(rng.choices(syllables, k=rng.randint(1, 4))) for _ in range(5000)]
+        entries = []
+        for id in range(options["entries"]):
+            kind = rng.choice(KINDS)
+            label = " ".join(rng.choices(words, k=1 if kind != "story" else rng.randint(1, 6)))
+            entries.append(Entry(kind, id, label, rng.randint(0, 500), normalize_name(label)))
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        index = PrefixIndex(entries)
+        built = time.perf_counter() - started
+        size, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(
+            f"index: {len(index)} entries, {len(index.keys)} keys, built in {built * 1000:.0f}ms, "
+            f"{size / 2 ** 20:.1f}MB ({peak / 2 ** 20:.1f}MB peak) on top of the labels"
+        )
+
+        prefixes = [rng.choice(words)[:rng.randint(1, 4)] for _ in range(options["queries"])]
+        self.report("suggest, first time", self.time_each(
+            prefixes, lambda prefix: index.suggest(prefix)))
+        self.report("suggest, again", self.time_each(
+            prefixes, lambda prefix: index.suggest(prefix)))
+        self.report("suggest, tags only", self.time_each(
+            prefixes, lambda prefix: index.suggest(prefix, ("tag",))))
+
+        changes = rng.sample(entries, min(1000, len(entries)))
+        self.report("update", self.time_each(
+            changes, lambda entry: index.put(entry.kind, entry.id, entry.label + " x", entry.weight)))
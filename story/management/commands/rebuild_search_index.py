@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from story.models import Story
+from story.search_backends import index_stories
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the full-text search documents of every story "
+        "(or only of stories without one with --missing)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--missing", action="store_true")
+        parser.add_argument("--batch-size", type=int, default=200)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        stories = Story.objects.all()
+        if options["missing"]:
+            stories = stories.filter(search_document__isnull=True)
+        last_id = 0
+        total = 0
+        while True:
+            ids = list(
+                stories.filter(id__gt=last_id)
+                .order_by("id")
+                .values_list("id", flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            total += index_stories(ids)
+            last_id = ids[-1]
+            self.stdout.write(f"\r{total} stories indexed", ending="")
+        self.stdout.write(f"\r{total} stories indexed")
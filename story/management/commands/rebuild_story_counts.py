@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from category.models import Category
+from tag.models import Tag
+
+
+class Command(BaseCommand):
+    help = "Recount the stories of every tag and category"
+
+    def handle(self, *args, **options):
+        tags = Tag.objects.all().refresh_story_counts()
+        categories = Category.objects.all().refresh_story_counts()
+        self.stdout.write(f"{tags} tags and {categories} categories recounted")
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from story.models import ChapterContent
+from story.rendering import RENDERER_VERSION, render
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-render the stored HTML of chapters rendered by an older renderer "
+        "version (or of every chapter with --all)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true")
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        contents = ChapterContent.objects.select_related("chapter").only(
+            "chapter_id", "body", "chapter__body_format")
+        if not options["all"]:
+            contents = contents.exclude(renderer_version=RENDERER_VERSION)
+        last_id = 0
+        total = 0
+        while True:
+            batch = list(contents.filter(pk__gt=last_id).order_by("pk")[:batch_size])
+            if not batch:
+                break
+            for content in batch:
+                content.rendered = render(content.body, content.chapter.body_format)
+                content.renderer_version = RENDERER_VERSION
+            # bulk_update leaves modified_at alone; the output only changes form
+            ChapterContent.objects.bulk_update(batch, ["rendered", "renderer_version"])
+            total += len(batch)
+            last_id = batch[-1].pk
+            self.stdout.write(f"\r{total} chapters rendered", ending="")
+        self.stdout.write(f"\r{total} chapters rendered")
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('story', '0001_squashed_0017_alter_story_slug'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='story',
+            name='excerpt',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
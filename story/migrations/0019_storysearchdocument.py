@@ -0,0 +1,73 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+SQLITE_CREATE = [
+    """CREATE VIRTUAL TABLE story_storysearchdocument_fts USING fts5(
+        title, brief, author, body,
+        content='story_storysearchdocument', content_rowid='story_id'
+    )""",
+    """CREATE TRIGGER story_storysearchdocument_ai AFTER INSERT ON story_storysearchdocument BEGIN
+        INSERT INTO story_storysearchdocument_fts(rowid, title, brief, author, body)
+        VALUES (new.story_id, new.title, new.brief, new.author, new.body);
+    END""",
+    """CREATE TRIGGER story_storysearchdocument_ad AFTER DELETE ON story_storysearchdocument BEGIN
+        INSERT INTO story_storysearchdocument_fts(story_storysearchdocument_fts, rowid, title, brief, author, body)
+        VALUES ('delete', old.story_id, old.title, old.brief, old.author, old.body);
+    END""",
+    """CREATE TRIGGER story_storysearchdocument_au AFTER UPDATE ON story_storysearchdocument BEGIN
+        INSERT INTO story_storysearchdocument_fts(story_storysearchdocument_fts, rowid, title, brief, author, body)
+        VALUES ('delete', old.story_id, old.title, old.brief, old.author, old.body);
+        INSERT INTO story_storysearchdocument_fts(rowid, title, brief, author, body)
+        VALUES (new.story_id, new.title, new.brief, new.author, new.body);
+    END""",
+]
+
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS story_storysearchdocument_au",
+    "DROP TRIGGER IF EXISTS story_storysearchdocument_ad",
+    "DROP TRIGGER IF EXISTS story_storysearchdocument_ai",
+    "DROP TABLE IF EXISTS story_storysearchdocument_fts",
+]
+
+MYSQL_CREATE = [
+    "ALTER TABLE story_storysearchdocument "
+    "ADD FULLTEXT INDEX story_search_fulltext (title, brief, author, body)",
+]
+
+MYSQL_DROP = [
+    "ALTER TABLE story_storysearchdocument DROP INDEX story_search_fulltext",
+]
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+create_fulltext_index = run_for_vendor({"sqlite": SQLITE_CREATE, "mysql": MYSQL_CREATE})
+drop_fulltext_index = run_for_vendor({"sqlite": SQLITE_DROP, "mysql": MYSQL_DROP})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('story', '0018_story_excerpt'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StorySearchDocument',
+            fields=[
+                ('story', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='story.story')),
+                ('title', models.CharField(blank=True, default='', max_length=255)),
+                ('brief', models.TextField(blank=True, default='')),
+                ('author', models.CharField(blank=True, default='', max_length=50)),
+                ('body', models.TextField(blank=True, default='')),
+            ],
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
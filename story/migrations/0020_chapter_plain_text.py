@@ -0,0 +1,70 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:37
+
+import html
+
+from django.db import migrations, models
+from django.utils.html import strip_tags
+
+BATCH_SIZE = 500
+
+MYSQL_CREATE = [
+    "ALTER TABLE story_storysearchdocument "
+    "ADD FULLTEXT INDEX story_search_title (title), "
+    "ADD FULLTEXT INDEX story_search_brief (brief), "
+    "ADD FULLTEXT INDEX story_search_author (author), "
+    "ADD FULLTEXT INDEX story_search_body (body)",
+]
+
+MYSQL_DROP = [
+    "ALTER TABLE story_storysearchdocument "
+    "DROP INDEX story_search_title, "
+    "DROP INDEX story_search_brief, "
+    "DROP INDEX story_search_author, "
+    "DROP INDEX story_search_body",
+]
+
+
+def fill_plain_text(apps, schema_editor):
+    Chapter = apps.get_model("story", "Chapter")
+    last_id = 0
+    while True:
+        chapters = list(
+            Chapter.objects.filter(id__gt=last_id)
+            .order_by("id")
+            .only("id", "body")[:BATCH_SIZE]
+        )
+        if not chapters:
+            break
+        for chapter in chapters:
+            chapter.plain_text = strip_tags(html.unescape(chapter.body)) if chapter.body else ""
+        Chapter.objects.bulk_update(chapters, ["plain_text"])
+        last_id = chapters[-1].id
+
+
+def create_field_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == "mysql":
+        for statement in MYSQL_CREATE:
+            schema_editor.execute(statement)
+
+
+def drop_field_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == "mysql":
+        for statement in MYSQL_DROP:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('story', '0019_storysearchdocument'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chapter',
+            name='plain_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(fill_plain_text, migrations.RunPython.noop),
+        migrations.RunPython(create_field_indexes, drop_field_indexes),
+    ]
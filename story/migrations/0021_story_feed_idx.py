@@ -0,0 +1,21 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('category', '0001_squashed_0006_alter_category_description'),
+        ('story', '0020_chapter_plain_text'),
+        ('tag', '0001_squashed_0004_tag_old_brawna_term_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='story',
+            index=models.Index(fields=['is_published', 'created_at', 'id'], name='story_feed_idx'),
+        ),
+    ]
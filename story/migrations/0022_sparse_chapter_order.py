@@ -0,0 +1,37 @@
+from django.db import migrations, models
+from django.db.models import F
+
+# StoryChaptersQuerySet.ORDER_GAP at the time of this migration
+ORDER_GAP = 1024
+
+
+def spread_orders(apps, schema_editor):
+    # one statement; relative order (ties included) is unchanged
+    StoryChapters = apps.get_model("story", "StoryChapters")
+    StoryChapters.objects.update(order=F("order") * ORDER_GAP)
+
+
+def pack_orders(apps, schema_editor):
+    # back to the old contract, order == position
+    StoryChapters = apps.get_model("story", "StoryChapters")
+    Story = apps.get_model("story", "Story")
+    for story_id in Story.objects.values_list("id", flat=True).iterator():
+        rows = list(StoryChapters.objects.filter(story_id=story_id).order_by("order", "pk"))
+        for index, row in enumerate(rows):
+            row.order = index
+        StoryChapters.objects.bulk_update(rows, ["order"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('story', '0021_story_feed_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(spread_orders, pack_orders),
+        migrations.AddIndex(
+            model_name='storychapters',
+            index=models.Index(fields=['story', 'order'], name='storychapters_order_idx'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.1.4 on 2026-10-18 20:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def copy_to_content(apps, schema_editor):
+    # keyset batches, so memory stays flat however large the bodies
+    Chapter = apps.get_model("story", "Chapter")
+    ChapterContent = apps.get_model("story", "ChapterContent")
+    last_id = 0
+    while True:
+        batch = list(
+            Chapter.objects.filter(pk__gt=last_id).order_by("pk")
+            .values_list("pk", "body", "plain_text")[:BATCH_SIZE])
+        if not batch:
+            break
+        ChapterContent.objects.bulk_create([
+            ChapterContent(chapter_id=pk, body=body, plain_text=plain_text)
+            for pk, body, plain_text in batch
+        ])
+        last_id = batch[-1][0]
+
+
+def copy_from_content(apps, schema_editor):
+    Chapter = apps.get_model("story", "Chapter")
+    ChapterContent = apps.get_model("story", "ChapterContent")
+    last_id = 0
+    while True:
+        batch = list(
+            ChapterContent.objects.filter(pk__gt=last_id).order_by("pk")
+            .values_list("pk", "body", "plain_text")[:BATCH_SIZE])
+        if not batch:
+            break
+        Chapter.objects.bulk_update([
+            Chapter(pk=pk, body=body, plain_text=plain_text)
+            for pk, body, plain_text in batch
+        ], ["body", "plain_text"])
+        last_id = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('story', '0022_sparse_chapter_order'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChapterContent',
+            fields=[
+                ('chapter', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='content', serialize=False, to='story.chapter')),
+                ('body', models.TextField(blank=True)),
+                ('plain_text', models.TextField(blank=True, default='', editable=False)),
+            ],
+        ),
+        migrations.RunPython(copy_to_content, copy_from_content),
+        migrations.RemoveField(
+            model_name='chapter',
+            name='body',
+        ),
+        migrations.RemoveField(
+            model_name='chapter',
+            name='plain_text',
+        ),
+    ]
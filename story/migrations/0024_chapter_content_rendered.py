@@ -0,0 +1,71 @@
+# Generated by Django 5.1.4 on 2026-10-18 20:31
+
+import html
+import unicodedata
+
+from django.db import migrations, models
+from django.utils.html import linebreaks, strip_tags
+
+BATCH_SIZE = 500
+
+
+def normalize_body(body):
+    if not body:
+        return ""
+    body = body.replace("\r\n", "\n").replace("\r", "\n")
+    return unicodedata.normalize("NFC", body).strip()
+
+
+def has_markup(body):
+    return strip_tags(body) != body
+
+
+def render_body(body):
+    if not body:
+        return ""
+    if has_markup(body):
+        return body
+    return linebreaks(body, autoescape=True)
+
+
+def make_plain_text(body):
+    if not body:
+        return ""
+    return strip_tags(html.unescape(body))
+
+
+def unescape_and_render(apps, schema_editor):
+    # Chapters saved through the API were stored HTML-escaped and
+    # unescaped on every read; unescape them once, here. Bodies with tags
+    # are imports, stored as HTML, and are kept as they are.
+    ChapterContent = apps.get_model("story", "ChapterContent")
+    last_id = 0
+    while True:
+        batch = list(ChapterContent.objects.filter(pk__gt=last_id).order_by("pk")[:BATCH_SIZE])
+        if not batch:
+            break
+        for content in batch:
+            body = content.body or ""
+            if not has_markup(body):
+                body = html.unescape(body)
+            content.body = normalize_body(body)
+            content.plain_text = make_plain_text(content.body)
+            content.rendered = render_body(content.body)
+        ChapterContent.objects.bulk_update(batch, ["body", "plain_text", "rendered"])
+        last_id = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('story', '0023_chapter_content'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chaptercontent',
+            name='rendered',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(unescape_and_render, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.4 on 2026-10-18 20:35
+
+from django.db import migrations, models
+
+
+def mark_rendered(apps, schema_editor):
+    # every chapter is plain text so far, and 0024 rendered it the way
+    # renderer version 1 does
+    ChapterContent = apps.get_model("story", "ChapterContent")
+    ChapterContent.objects.update(renderer_version=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('story', '0024_chapter_content_rendered'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chapter',
+            name='body_format',
+            field=models.CharField(choices=[('text', 'Plain text'), ('markdown', 'Markdown')], default='text', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='chaptercontent',
+            name='renderer_version',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(mark_rendered, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+def mark_text_rendered(apps, schema_editor):
+    # renderer version 2 only changed how Markdown links are checked, so
+    # plain text rendered by version 1 is what version 2 would store;
+    # Markdown chapters are left for rerender_chapters
+    ChapterContent = apps.get_model("story", "ChapterContent")
+    ChapterContent.objects.filter(
+        renderer_version=1, chapter__body_format="text").update(renderer_version=2)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('story', '0025_chapter_body_format'),
+    ]
+
+    operations = [
+        migrations.RunPython(mark_text_rendered, migrations.RunPython.noop),
+    ]
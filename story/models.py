@@ -2,33 +2,205 @@ from random import randint
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db import models
-from django.utils.html import strip_tags
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Count, F, OuterRef, Prefetch, Q, Subquery, Window
+from django.db.models.expressions import RowRange
+from django.db.models.functions import FirstValue, Lag, Lead, RowNumber
+from django.dispatch import Signal
+from django.utils.text import slugify
 
 from category.models import Category
 from tag.models import Tag
 
+from . import rendering
+from .utils import make_excerpt, make_plain_text, normalize_body
+
+class ChapterQuerySet(models.QuerySet):
+    def with_body(self):
+        # for the paths that show or edit the text
+        return self.select_related("content")
+
+    def in_story(self, story_id):
+        # the order of Story.chapter_list()
+        return self.filter(storychapters__story_id=story_id).order_by(
+            "storychapters__order", "storychapters__pk")
+
+    def create_many(self, chapters):
+        """
+        Save unsaved chapters and their content. One INSERT each for the
+        chapters and the content where the database returns the new ids
+        from a bulk insert (not MySQL); row by row otherwise, since the ids
+        are needed to attach the content and the chapters.
+        """
+        with transaction.atomic():
+            if not connection.features.can_return_rows_from_bulk_insert:
+                for chapter in chapters:
+                    chapter.save()
+                return chapters
+            self.bulk_create(chapters)
+            contents = [ChapterContent(chapter=chapter, body=chapter.body) for chapter in chapters]
+            for content in contents:
+                content.render()
+            ChapterContent.objects.bulk_create(contents)
+        return chapters
+
 # Create your models here.
 class Chapter(models.Model):
     title = models.CharField(blank=True, max_length=255, default="")
-    body = models.TextField(blank=True)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
     old_brawna_id = models.IntegerField(null=True, blank=True)
     old_brawna_parent_id = models.IntegerField(null=True, blank=True)
     is_featured = models.BooleanField(default=False)
+    body_format = models.CharField(
+        max_length=10,
+        choices=[(rendering.TEXT, "Plain text"), (rendering.MARKDOWN, "Markdown")],
+        default=rendering.TEXT,
+    )
+
+    objects = ChapterQuerySet.as_manager()
+
+    # The text lives in ChapterContent, so that the many places listing
+    # chapters never load it. Reading body costs a query unless the
+    # chapter came from Chapter.objects.with_body(); setting it is kept
+    # on the instance until save().
+    @property
+    def body(self):
+        if "_body" in self.__dict__:
+            return self._body
+        try:
+            return self.content.body
+        except ChapterContent.DoesNotExist:
+            return ""
+
+    @body.setter
+    def body(self, value):
+        self._body = value
  
     def save(self, *args, **kwargs):
-         # If we have an old_brawna_id, it's an import, allow HTML
-         # Not sure if this is a good idea!
-         if strip_tags(self.body) != self.body and self.old_brawna_id == 0:
-            raise ValidationError("Chapter body should not contain HTML tags.")
-         super().save(*args, **kwargs)
+        # the body is validated where it comes in (ChapterSerializer);
+        # imports may carry HTML
+        body = self.__dict__.get("_body")
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if body is not None:
+                self.content = ChapterContent(chapter=self, body=body)
+                self.content.save()
+                del self._body
 
     def __str__(self):
         return self.title
 
+class ChapterContent(models.Model):
+    chapter = models.OneToOneField(
+        Chapter,
+        primary_key     = True,
+        related_name    = 'content',
+        on_delete       = models.CASCADE
+    )
+    # the text as written, normalized (see story.utils.normalize_body);
+    # served as it is, never escaped or unescaped on the way in or out
+    body = models.TextField(blank=True)
+    # body without tags or entities, for excerpts and search snippets
+    plain_text = models.TextField(blank=True, default="", editable=False)
+    # body as HTML in the chapter's body_format, ready to serve, and the
+    # story.rendering.RENDERER_VERSION that produced it
+    rendered = models.TextField(blank=True, default="", editable=False)
+    renderer_version = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    def render(self):
+        # everything derived from the body is computed here, once per write
+        self.body = normalize_body(self.body)
+        self.plain_text = make_plain_text(self.body)
+        self.rendered = rendering.render(self.body, self.chapter.body_format)
+        self.renderer_version = rendering.RENDERER_VERSION
+
+    def get_rendered(self):
+        if self.renderer_version != rendering.RENDERER_VERSION:
+            # not re-rendered yet, see rerender_chapters
+            return rendering.render(self.body, self.chapter.body_format)
+        return self.rendered
+
+    def save(self, *args, **kwargs):
+        self.render()
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"Content of {self.chapter_id}"
+
+class StoryQuerySet(models.QuerySet):
+    def for_list(self):
+        # Everything StorySerializer reads, in a fixed number of queries:
+        # the story rows (with user), plus one prefetch each for tags,
+        # categories and chapter ids.
+        return self.select_related("user").prefetch_related(
+            "tags",
+            "categories",
+            Prefetch("chapters", queryset=Chapter.objects.only("id")),
+        )
+
+    def with_all(self, tag_ids=(), category_ids=()):
+        # Stories carrying every one of the tags and categories. Each id
+        # is an IN (SELECT story_id ...) read from the m2m table's index
+        # on tag_id/category_id, so only the stories filed under it are
+        # looked at; see bench_facets for the plan.
+        for tag_id in tag_ids:
+            self = self.filter(pk__in=Story.tags.through.objects.filter(
+                tag_id=tag_id).values("story_id"))
+        for category_id in category_ids:
+            self = self.filter(pk__in=Story.categories.through.objects.filter(
+                category_id=category_id).values("story_id"))
+        return self
+
+    def with_first_chapter_text(self):
+        first_chapter_text = StoryChapters.objects.filter(
+            story=OuterRef("pk")).order_by("order", "pk").values("chapter__content__plain_text")[:1]
+        return self.annotate(first_chapter_text=Subquery(first_chapter_text))
+
+    def refresh_excerpts(self):
+        # bulk_update rather than save() so the derived column doesn't
+        # bump modified_at
+        stories = list(self.with_first_chapter_text().only("id"))
+        for story in stories:
+            story.excerpt = make_excerpt(story.first_chapter_text)
+        self.model.objects.bulk_update(stories, ["excerpt"])
+        return len(stories)
+
+    SLUG_LENGTH = 20
+    SLUG_ATTEMPTS = 5
+
+    def free_slug(self, base):
+        """
+        base, or base-N with the lowest N not in use, from one query over
+        the slugs taken by base and its suffixed forms
+        """
+        taken = set(
+            self.filter(models.Q(slug=base) | models.Q(slug__startswith=f"{base}-"))
+            .values_list("slug", flat=True)
+        )
+        slug, i = base, 1
+        while slug in taken:
+            slug = f"{base}-{i}"
+            i += 1
+        return slug
+
+    def create_with_slug(self, title, **fields):
+        """
+        Create a story with a unique slug made from its title. The unique
+        constraint settles races: when another story takes the slug
+        between the lookup and the insert, look again.
+        """
+        base = slugify(title)[:self.SLUG_LENGTH] or "story"
+        for attempt in range(self.SLUG_ATTEMPTS):
+            slug = self.free_slug(base)
+            try:
+                with transaction.atomic():
+                    return self.create(title=title, slug=slug, **fields)
+            except IntegrityError:
+                if attempt == self.SLUG_ATTEMPTS - 1:
+                    raise
+
 class Story(models.Model):
     title = models.CharField(blank=False, null=False, max_length=255)
     brief = models.TextField(blank=True, default="")
@@ -43,6 +215,7 @@ class Story(models.Model):
     old_brawna_parent_id = models.IntegerField(null=True, blank=True)
     is_published = models.BooleanField(default=False)
     has_chapters = models.BooleanField(default=False)
+    excerpt = models.TextField(blank=True, default="")
     chapters = models.ManyToManyField(
         Chapter,
         through         = 'StoryChapters',
@@ -50,12 +223,165 @@ class Story(models.Model):
         verbose_name    = (u'Chapter'),
         help_text       = (u'Chapters in this Story')
     )
+
+    objects = StoryQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # newest-first feeds and their (created_at, id) keyset cursor
+            models.Index(fields=["is_published", "created_at", "id"], name="story_feed_idx"),
+        ]
         
     def __str__(self):
         return self.title
     
     def chapter_list(self):
-        return [sc.chapter for sc in StoryChapters.objects.filter(story=self).order_by('order')]
+        return [sc.chapter for sc in StoryChapters.objects.in_story(self).select_related('chapter')]
+
+# sent with story_id after a story's chapters were added or reordered in
+# bulk, which skips the per-row save signals
+chapters_changed = Signal()
+
+
+class StoryChaptersQuerySet(models.QuerySet):
+    """
+    StoryChapters.order is sparse: chapters start ORDER_GAP apart and an
+    insert takes the midpoint of its neighbours, so adding or removing a
+    chapter writes a single row. Only when two neighbours have run out of
+    room between them are the story's chapters spaced out again. Order
+    values mean nothing on their own; a chapter's position is its index
+    in (order, pk).
+    """
+
+    ORDER_GAP = 1024
+
+    def in_story(self, story):
+        return self.filter(story=story).order_by("order", "pk")
+
+    def chapters(self, story, batch_size):
+        """
+        The story's chapters with their bodies, in order. Each batch_size of
+        them is a query of its own, starting after the (order, pk) the last
+        one ended on, so only one batch is held at a time however the
+        database driver buffers results (mysqlclient reads all of a query's
+        rows, QuerySet.iterator() included).
+        """
+        rows = self.in_story(story).values_list("order", "pk", "chapter_id")
+        batch = list(rows[:batch_size])
+        while batch:
+            by_id = Chapter.objects.with_body().in_bulk(
+                [chapter_id for _, _, chapter_id in batch])
+            for _, _, chapter_id in batch:
+                if chapter_id in by_id:
+                    # unless deleted in between
+                    yield by_id[chapter_id]
+            order, pk, _ = batch[-1]
+            batch = list(rows.filter(
+                Q(order__gt=order) | Q(order=order, pk__gt=pk))[:batch_size])
+
+    def orders_at(self, story, pos, count=1):
+        # orders for count new chapters so that they land at index pos,
+        # or None when their neighbours are too close together
+        pos = max(pos, 0)
+        neighbours = list(
+            self.in_story(story).values_list("order", flat=True)[max(pos - 1, 0):pos + 1])
+        if not neighbours and pos > 0:
+            # past the end, so after the last chapter
+            neighbours = list(self.in_story(story).reverse().values_list("order", flat=True)[:1])
+        if not neighbours:
+            return [i * self.ORDER_GAP for i in range(count)]
+        if pos == 0:
+            return [neighbours[0] - (count - i) * self.ORDER_GAP for i in range(count)]
+        if len(neighbours) == 1:
+            return [neighbours[0] + (i + 1) * self.ORDER_GAP for i in range(count)]
+        before, after = neighbours
+        step = (after - before) // (count + 1)
+        if step < 1:
+            return None
+        return [before + (i + 1) * step for i in range(count)]
+
+    def insert(self, story, chapter, pos=None):
+        """
+        Add chapter to story at index pos (the end when None)
+        """
+        return self.insert_many(story, [chapter], pos, bulk=False)[0]
+
+    def insert_many(self, story, chapters, pos=None, bulk=True):
+        """
+        Add saved chapters to story, in the given order, starting at index
+        pos (the end when None). bulk inserts every row in one statement
+        and sends chapters_changed instead of the per-row save signals.
+        """
+        with transaction.atomic():
+            if pos is None:
+                pos = self.filter(story=story).count()
+            orders = self.orders_at(story, pos, len(chapters))
+            if orders is None:
+                self.rebalance(story, gap=max(self.ORDER_GAP, len(chapters) + 1))
+                orders = self.orders_at(story, pos, len(chapters))
+            rows = [
+                self.model(story=story, chapter=chapter, order=order)
+                for chapter, order in zip(chapters, orders)
+            ]
+            if not bulk:
+                for row in rows:
+                    row.save()
+                return rows
+            self.bulk_create(rows)
+            chapters_changed.send(sender=self.model, story_id=story.pk)
+        return rows
+
+    def reorder(self, story, chapter_ids):
+        """
+        Put the story's chapters in the order of chapter_ids, which has to
+        name each of them exactly once. One UPDATE for the whole story.
+        """
+        with transaction.atomic():
+            rows = {
+                row.chapter_id: row
+                for row in self.filter(story=story).select_for_update().only("id", "chapter_id", "order")
+            }
+            if len(chapter_ids) != len(rows) or set(chapter_ids) != set(rows):
+                raise ValidationError(
+                    "Chapter order should list every chapter of the story exactly once.")
+            for index, chapter_id in enumerate(chapter_ids):
+                rows[chapter_id].order = index * self.ORDER_GAP
+            self.bulk_update(rows.values(), ["order"])
+            chapters_changed.send(sender=self.model, story_id=story.pk)
+        return len(rows)
+
+    def navigation(self, chapter_id):
+        """
+        Where a chapter sits in its story, from window functions over the
+        story's rows in one query: a dict of story_id, position (from 0),
+        chapter_count, prev_chapter and next_chapter (None at either end),
+        or None for a chapter that isn't in a story.
+        """
+        in_order = [F("order").asc(), F("pk").asc()]
+        story_id = self.filter(chapter_id=chapter_id).values("story_id")[:1]
+        return (
+            self.filter(story_id=Subquery(story_id))
+            .annotate(
+                position=Window(RowNumber(), order_by=in_order) - 1,
+                chapter_count=Window(Count("pk")),
+                prev_chapter=Window(Lag("chapter_id"), order_by=in_order),
+                next_chapter=Window(Lead("chapter_id"), order_by=in_order),
+                # the row's own chapter, as a window so that filtering on it
+                # happens after the windows are computed, not before
+                current=Window(FirstValue("chapter_id"), frame=RowRange(0, 0)),
+            )
+            .filter(current=chapter_id)
+            .values("story_id", "position", "chapter_count", "prev_chapter", "next_chapter")
+            .first()
+        )
+
+    def rebalance(self, story, gap=ORDER_GAP):
+        rows = list(self.in_story(story).only("id", "order"))
+        for index, row in enumerate(rows):
+            row.order = index * gap
+        self.bulk_update(rows, ["order"], batch_size=500)
+        return len(rows)
+
 
 class StoryChapters(models.Model):
     story = models.ForeignKey(
@@ -75,11 +401,34 @@ class StoryChapters(models.Model):
         help_text       = (u'Order of this chapter within the story')
     )
 
+    objects = StoryChaptersQuerySet.as_manager()
+
     class Meta:
         verbose_name = (u"Story Chapter")
         verbose_name_plural = (u"Story Chapters")
         ordering = ['order']
         unique_together = (('story', 'chapter'),)
+        indexes = [
+            # a story's chapters in order, and the neighbours of an insert
+            models.Index(fields=["story", "order"], name="storychapters_order_idx"),
+        ]
 
     def __unicode__(self):
         return self.chapter.title + (" in position %d" % self.order) + " of " + self.story.title
+
+class StorySearchDocument(models.Model):
+    # Denormalized, plain text copy of a story used by the full-text
+    # index (see story.search_backends). Kept in sync by story.signals.
+    story = models.OneToOneField(
+        Story,
+        primary_key     = True,
+        related_name    = 'search_document',
+        on_delete       = models.CASCADE
+    )
+    title = models.CharField(max_length=255, blank=True, default="")
+    brief = models.TextField(blank=True, default="")
+    author = models.CharField(max_length=50, blank=True, default="")
+    body = models.TextField(blank=True, default="")
+
+    def __str__(self):
+        return self.title
@@ -0,0 +1,89 @@
+from base64 import b64decode, b64encode
+from binascii import Error as DecodeError
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class CustomPagination(PageNumberPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class FeedPagination(CustomPagination):
+    """
+    Page number pagination by default. A request with a cursor parameter
+    (empty for the first page) switches to keyset pagination on
+    (created_at, id), newest first: every page is a single indexed range
+    scan with no OFFSET and no COUNT(*), and stories published while a
+    reader pages through don't shift the pages they have not seen yet.
+
+    Subclasses may flip ordering to ("created_at", "id") for oldest first.
+    """
+
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+    ordering = ("-created_at", "-id")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.cursor_query_param in request.query_params
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request.query_params[self.cursor_query_param])
+        queryset = queryset.order_by(*self.ordering)
+        if position:
+            queryset = queryset.filter(self.after(*position))
+
+        # one extra row tells us whether there is a next page
+        page = list(queryset[:page_size + 1])
+        self.has_next = len(page) > page_size
+        page = page[:page_size]
+        self.last = page[-1] if page else None
+        return page
+
+    def after(self, created_at, id):
+        # rows following the cursor position in self.ordering
+        if self.ordering[0].startswith("-"):
+            return Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=id)
+        return Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=id)
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response({
+            "next": self.get_next_link(),
+            "results": data,
+        })
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.last))
+
+    def encode_cursor(self, obj):
+        position = f"{obj.created_at.isoformat()}|{obj.id}"
+        return b64encode(position.encode("ascii")).decode("ascii")
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            created_at, id = b64decode(cursor.encode("ascii"), validate=True).decode("ascii").split("|")
+            created_at = parse_datetime(created_at)
+            id = int(id)
+        except (DecodeError, UnicodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created_at, id
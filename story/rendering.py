@@ -0,0 +1,68 @@
+"""
+Chapter bodies rendered to HTML at write time (see ChapterContent.render).
+
+Markdown is rendered without raw HTML, and links or images lose their
+target unless it is an http(s) or mailto URL or a path starting with /,
+# or ?, so the output is safe to insert into a page as it is. Bump RENDERER_VERSION
+whenever the output of render() changes; the deploy runs rerender_chapters.
+"""
+import html
+import re
+from urllib.parse import urlsplit
+
+import markdown
+from markdown.extensions import Extension
+from markdown.treeprocessors import Treeprocessor
+
+from .utils import render_body
+
+RENDERER_VERSION = 2
+
+TEXT = "text"
+MARKDOWN = "markdown"
+
+SAFE_SCHEMES = {"http", "https", "mailto"}
+SAFE_PREFIXES = ("/", "#", "?")
+URL_ATTRIBUTES = ("href", "src")
+# browsers ignore these inside a scheme, e.g. "java\tscript:"
+IGNORED_URL_CHARS = re.compile(r"[\x00-\x20\x7f]")
+
+
+def is_safe_url(url):
+    # Markdown keeps character references in URLs and the browser decodes
+    # them, so "&#106;avascript:" is checked as "javascript:"
+    url = IGNORED_URL_CHARS.sub("", html.unescape(url))
+    if url.startswith(SAFE_PREFIXES):
+        return True
+    try:
+        scheme = urlsplit(url).scheme
+    except ValueError:
+        return False
+    return scheme.lower() in SAFE_SCHEMES
+
+
+class UnsafeURLRemover(Treeprocessor):
+    def run(self, root):
+        for element in root.iter():
+            for attribute in URL_ATTRIBUTES:
+                url = element.get(attribute)
+                if url is not None and not is_safe_url(url):
+                    del element.attrib[attribute]
+
+
+class SafeMarkdown(Extension):
+    def extendMarkdown(self, md):
+        # raw HTML stays text and is escaped like any other
+        md.preprocessors.deregister("html_block")
+        md.inlinePatterns.deregister("html")
+        md.treeprocessors.register(UnsafeURLRemover(md), "unsafe_urls", 0)
+
+
+def render_markdown(body):
+    return markdown.markdown(body, extensions=[SafeMarkdown()])
+
+
+def render(body, body_format=TEXT):
+    if body_format == MARKDOWN:
+        return render_markdown(body) if body else ""
+    return render_body(body)
@@ -0,0 +1,189 @@
+import re
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, ExpressionWrapper, FloatField, Q, Value, When
+from django.utils.module_loading import import_string
+
+from .models import Story, StoryChapters, StorySearchDocument
+from .utils import make_snippet
+
+TOKEN_RE = re.compile(r"\w+")
+DOCUMENT_FIELDS = ("title", "brief", "author", "body")
+
+
+def tokenize(query):
+    return TOKEN_RE.findall(query or "")
+
+
+class SearchBackend:
+    """
+    Finds and ranks published stories for SearchStoryView. Subclasses only
+    change how StorySearchDocument rows are matched and scored; the
+    documents themselves are maintained by index_stories() for every
+    backend.
+
+    search() adds a search_rank to each story, higher is better.
+    """
+
+    # relative weight of a match in each document field
+    weights = {"title": 10.0, "brief": 4.0, "author": 4.0, "body": 1.0}
+
+    def search(self, queryset, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset.none()
+        return self.match(queryset, tokens)
+
+    def match(self, queryset, tokens):
+        raise NotImplementedError
+
+    def snippets(self, story_ids, query):
+        """
+        Marked up snippets of the chapter text, by story id. Only meant to
+        be called for a page of results.
+        """
+        tokens = tokenize(query)
+        documents = StorySearchDocument.objects.filter(
+            story_id__in=story_ids).values_list("story_id", "body")
+        return {
+            story_id: make_snippet(body, tokens)
+            for story_id, body in documents.iterator()
+        }
+
+
+class ContainsSearchBackend(SearchBackend):
+    # Fallback for databases without a full-text index. Still scans, but
+    # one denormalized row per story rather than the chapter join.
+    def match(self, queryset, tokens):
+        score = Value(0.0)
+        for token in tokens:
+            queryset = queryset.filter(
+                Q(search_document__title__icontains=token)
+                | Q(search_document__brief__icontains=token)
+                | Q(search_document__author__icontains=token)
+                | Q(search_document__body__icontains=token)
+            )
+            for field, weight in self.weights.items():
+                score = score + Case(
+                    When(**{f"search_document__{field}__icontains": token}, then=Value(weight)),
+                    default=Value(0.0),
+                )
+        return queryset.annotate(search_rank=ExpressionWrapper(score, output_field=FloatField()))
+
+
+# The full-text backends join the index with extra() rather than filtering
+# on a subquery: the rank has to come from the same statement that runs the
+# MATCH, otherwise it is recomputed per matching row.
+
+class SQLiteFTSBackend(SearchBackend):
+    # FTS5 table created by migration 0019, kept in sync by triggers
+    table = "story_storysearchdocument_fts"
+
+    def match_expression(self, tokens):
+        return " AND ".join(f'"{token}"*' for token in tokens)
+
+    def match(self, queryset, tokens):
+        # bm25() is lower-is-better, with one weight per FTS column
+        weights = ", ".join(str(self.weights[field]) for field in DOCUMENT_FIELDS)
+        return queryset.extra(
+            select={"search_rank": f"-bm25({self.table}, {weights})"},
+            tables=[self.table],
+            where=[
+                f"{self.table} MATCH %s",
+                f"{self.table}.rowid = {Story._meta.db_table}.id",
+            ],
+            params=[self.match_expression(tokens)],
+        )
+
+
+class MySQLFulltextBackend(SearchBackend):
+    # FULLTEXT indexes created by migrations 0019 (all fields, for
+    # matching) and 0020 (one per field, for weighted scoring)
+    table = "story_storysearchdocument"
+
+    def match_expression(self, tokens):
+        return " ".join(f"+{token}*" for token in tokens)
+
+    def match(self, queryset, tokens):
+        expression = self.match_expression(tokens)
+        score = " + ".join(
+            f"{self.weights[field]} * MATCH ({self.table}.{field}) AGAINST (%s IN BOOLEAN MODE)"
+            for field in DOCUMENT_FIELDS
+        )
+        columns = ", ".join(f"{self.table}.{field}" for field in DOCUMENT_FIELDS)
+        return queryset.extra(
+            select={"search_rank": score},
+            select_params=[expression] * len(DOCUMENT_FIELDS),
+            tables=[self.table],
+            where=[
+                f"MATCH ({columns}) AGAINST (%s IN BOOLEAN MODE)",
+                f"{self.table}.story_id = {Story._meta.db_table}.id",
+            ],
+            params=[expression],
+        )
+
+
+VENDOR_BACKENDS = {
+    "sqlite": SQLiteFTSBackend,
+    "mysql": MySQLFulltextBackend,
+}
+
+
+def get_search_backend():
+    path = getattr(settings, "STORY_SEARCH_BACKEND", None)
+    if path:
+        return import_string(path)()
+    return VENDOR_BACKENDS.get(connection.vendor, ContainsSearchBackend)()
+
+
+def build_documents(story_ids):
+    bodies = defaultdict(list)
+    chapters = (
+        StoryChapters.objects.filter(story_id__in=story_ids)
+        .order_by("story_id", "order", "pk")
+        .values_list("story_id", "chapter__content__plain_text")
+    )
+    for story_id, text in chapters.iterator():
+        # NULL for a chapter without a content row
+        bodies[story_id].append(text or "")
+
+    stories = Story.objects.filter(id__in=story_ids).values_list(
+        "id", "title", "brief", "user__alias")
+    return [
+        StorySearchDocument(
+            story_id=story_id,
+            title=title,
+            brief=brief,
+            author=alias or "",
+            body="\n\n".join(bodies[story_id]),
+        )
+        for story_id, title, brief, alias in stories
+    ]
+
+
+def index_stories(story_ids):
+    """
+    (Re)build the search documents of the given stories, chapters included
+    """
+    story_ids = list(story_ids)
+    documents = build_documents(story_ids)
+    with transaction.atomic():
+        StorySearchDocument.objects.filter(story_id__in=story_ids).delete()
+        StorySearchDocument.objects.bulk_create(documents)
+    return len(documents)
+
+
+def index_story_metadata(story):
+    """
+    Refresh the story level fields of a document, leaving the chapter text
+    alone. Falls back to a full index if the story has no document yet.
+    """
+    updated = StorySearchDocument.objects.filter(story_id=story.pk).update(
+        title=story.title,
+        brief=story.brief,
+        author=story.user.alias,
+    )
+    if not updated:
+        index_stories([story.pk])
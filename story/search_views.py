@@ -1,50 +1,52 @@
 from rest_framework import generics
-from django.db.models import Q
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from accounts.permissions import IsAdmin, IsAuthor, IsAuth
 from tag.models import Tag
 from accounts.models import User
 from django.db.models import Count
 
+from . import typeahead
 from .models import Story
+from .pagination import FeedPagination
+from .search_backends import get_search_backend
 from .serializers import (
-    StorySerializer
+    StorySerializer,
+    StorySearchSerializer
 )
 
 from tag.serializers import TagSearchSerializer
 from accounts.serializers import UserSearchSerializer
-
-class CustomPagination(PageNumberPagination):
-    page_size_query_param = 'page_size'
-    max_page_size = 1000
+from config.response_cache import CachedResponseMixin
 
 class SearchStoryView(generics.ListAPIView):
-    serializer_class = StorySerializer
+    serializer_class = StorySearchSerializer
 
     def get_queryset(self):
         query = self.request.GET.get("q")
         if query:
             queryset = Story.objects.filter(is_published = True)
-            queryset = queryset.filter(
-                Q(chapters__body__icontains=query)
-                | Q(user__alias__icontains=query)
-                | Q(brief__icontains=query)
-                | Q(title__icontains=query)
-            ).distinct().order_by("title")
-            
+            queryset = get_search_backend().search(queryset, query)
+            queryset = queryset.for_list().order_by("-search_rank", "title")
         else:
             # return all stories if no search parameters are provided
             queryset = Story.objects.none()
         return queryset
 
+    def get_snippet_context(self, stories):
+        query = self.request.GET.get("q")
+        snippets = get_search_backend().snippets([story.id for story in stories], query)
+        return {**self.get_serializer_context(), "snippets": snippets}
+
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
         page = self.paginate_queryset(queryset)
         if page is not None:
-            serializer = self.get_serializer(page, many=True)
+            serializer = self.get_serializer(page, many=True, context=self.get_snippet_context(page))
             return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(queryset, many=True)
+        stories = list(queryset)
+        serializer = self.get_serializer(stories, many=True, context=self.get_snippet_context(stories))
         return Response(serializer.data)
     
 class SearchAuthorView(generics.ListAPIView):
@@ -83,7 +85,7 @@ class SearchTagView(generics.ListAPIView):
     def get_queryset(self):
         tag = self.request.GET.get("tag")
         if tag:
-            queryset = Tag.objects.filter(name__icontains=tag).order_by("name")
+            queryset = Tag.objects.prefixed(tag).order_by("name_normalized")
         else:
             # return all stories if no search parameters are provided
             queryset = Tag.objects.none()
@@ -99,12 +101,29 @@ class SearchTagView(generics.ListAPIView):
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)   
 
+class SuggestView(APIView):
+    permission_classes = []
+
+    def get(self, request):
+        kinds = request.GET.get("kind")
+        kinds = kinds.split(",") if kinds else typeahead.KINDS
+        try:
+            limit = min(max(int(request.GET.get("limit", 10)), 1), typeahead.MAX_LIMIT)
+        except ValueError:
+            limit = 10
+        entries = typeahead.get_index().suggest(request.GET.get("q", ""), kinds, limit)
+        return Response([
+            {"kind": entry.kind, "id": entry.id, "label": entry.label}
+            for entry in entries
+        ])
+
 class StoryListAdminAPIView(generics.ListAPIView):
     serializer_class = StorySerializer
     permission_classes = [IsAdmin]
+    pagination_class = FeedPagination
 
     def get_queryset(self, username):
-        queryset = Story.objects.all().order_by("-created_at")
+        queryset = Story.objects.for_list().order_by("-created_at", "-id")
         if (username):
             queryset = queryset.filter(user__alias__icontains=username)
         return queryset
@@ -119,10 +138,11 @@ class StoryListAdminAPIView(generics.ListAPIView):
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
-class StoryListAPIView(generics.ListAPIView):
+class StoryListAPIView(CachedResponseMixin, generics.ListAPIView):
     serializer_class = StorySerializer
-    queryset = Story.objects.filter(is_published=True).order_by("-created_at")
-    pagination_class = PageNumberPagination
+    cache_versions = ("stories", "tags", "categories")
+    queryset = Story.objects.filter(is_published=True).for_list().order_by("-created_at", "-id")
+    pagination_class = FeedPagination
     
 class StoryMineAPIView(generics.ListAPIView):
     serializer_class = StorySerializer
@@ -137,7 +157,7 @@ class StoryMineAPIView(generics.ListAPIView):
                 queryset = queryset.filter(is_published=False)
             else:
                 queryset = queryset.filter(is_published=True)
-            return queryset.order_by("-created_at")
+            return queryset.for_list().order_by("-created_at")
         else:
             return None
     
@@ -152,12 +172,13 @@ class StoryMineAPIView(generics.ListAPIView):
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
-class StoryFeaturedAPIView(generics.RetrieveAPIView):
+class StoryFeaturedAPIView(CachedResponseMixin, generics.RetrieveAPIView):
     serializer_class = StorySerializer
+    cache_versions = ("stories", "tags", "categories")
     permission_classes = []
 
     def get_queryset(self):
-        return Story.objects.all().filter(is_featured=True).order_by("-created_at")[:1]
+        return Story.objects.filter(is_featured=True).for_list().order_by("-created_at")[:1]
 
     def get(self, request):
         queryset = self.get_queryset()
@@ -171,7 +192,7 @@ class SavedStoriesAPIView(generics.ListAPIView):
 
     def get_queryset(self):
         user = self.request.user
-        return user.saved_stories.all().order_by("-created_at")
+        return user.saved_stories.for_list().order_by("-created_at")
     
     def list(self, request):
         queryset = self.get_queryset()
@@ -1,20 +1,21 @@
 from django.utils.html import strip_tags
 from rest_framework import serializers
-import html
 
 from category.models import Category
 from category.serializers import CategorySerializer
 from comment.models import Comment
+from comment.pagination import CommentPagination
 from comment.serializers import CommentSerializer
 from tag.models import Tag
 from tag.serializers import TagSerializer
-from django.utils.text import slugify
-from django.utils.text import Truncator
+from django.urls import reverse
+from django.utils.http import urlencode
 
 from .models import Story, Chapter, StoryChapters
 
 class ChapterSerializer(serializers.ModelSerializer):
     user = serializers.ReadOnlyField(source="user.alias")
+    body = serializers.CharField(allow_blank=True, required=False)
 
     class Meta:
         model = Chapter
@@ -51,22 +52,30 @@ class StorySerializer(serializers.ModelSerializer):
         )
 
     def get_first_category(self, obj):
-        cat = obj.categories.first()
-        if cat:
-            return cat.name
+        # all() rather than first() so a prefetched list is reused
+        categories = obj.categories.all()
+        if categories:
+            return min(categories, key=lambda cat: cat.pk).name
         return None
-    
+
     def get_excerpt(self, obj):
-        chapter = obj.chapters.first()
-        if chapter:
-            chapter_body = strip_tags(html.unescape(chapter.body))
-            if chapter_body and len(chapter_body) > 0:
-                truncator = Truncator(chapter_body)
-                return truncator.words(50,truncate="...")
-        return None
+        return obj.excerpt or None
+
+class StorySearchSerializer(StorySerializer):
+    snippet = serializers.SerializerMethodField()
+
+    def get_snippet(self, obj):
+        return self.context.get("snippets", {}).get(obj.id)
 
 class ChapterDetailSerializer(serializers.ModelSerializer):
-    body = serializers.SerializerMethodField()
+    body = serializers.ReadOnlyField()
+    rendered = serializers.ReadOnlyField(source="content.get_rendered")
+    # set by ChapterDetailAPIView, see StoryChapters.objects.navigation
+    story_id = serializers.ReadOnlyField(source="navigation.story_id")
+    position = serializers.ReadOnlyField(source="navigation.position")
+    chapter_count = serializers.ReadOnlyField(source="navigation.chapter_count")
+    prev_chapter = serializers.ReadOnlyField(source="navigation.prev_chapter")
+    next_chapter = serializers.ReadOnlyField(source="navigation.next_chapter")
 
     class Meta:
         model = Chapter
@@ -77,16 +86,12 @@ class ChapterDetailSerializer(serializers.ModelSerializer):
             "modified_date",
             "user",
         )
-    
-    def get_body(self, obj):
-        return html.unescape(obj.body)
 
 class StoryDetailSerializer(serializers.ModelSerializer):
     user = serializers.ReadOnlyField(source="user.alias")
     user_id = serializers.ReadOnlyField(source="user.id")
     categories = CategorySerializer(many=True, read_only=True)
     tags = TagSerializer(many=True, read_only=True)
-    comments = serializers.SerializerMethodField()
     chapter_summaries = serializers.SerializerMethodField()
 
     class Meta:
@@ -100,13 +105,36 @@ class StoryDetailSerializer(serializers.ModelSerializer):
             "user_id"
         )
 
-    def get_comments(self, obj):
-        comments = Comment.objects.filter(story=obj)
-        serializer = CommentSerializer(comments, many=True)
-        return serializer.data
+    def to_representation(self, obj):
+        data = super().to_representation(obj)
+        data.update(self.first_comments(obj))
+        return data
+
+    def first_comments(self, obj):
+        # Only the first page of comments is embedded; comments_next is the
+        # cursor into CommentListAPIView for the rest.
+        pagination = CommentPagination()
+        page_size = pagination.page_size
+        comments = list(
+            Comment.objects.filter(story=obj).for_list()
+            .order_by(*pagination.ordering)[:page_size + 1])
+        count, next_url = len(comments), None
+        if count > page_size:
+            comments = comments[:page_size]
+            next_url = reverse("comment:comment-list", args=[obj.id]) + "?" + urlencode(
+                {pagination.cursor_query_param: pagination.encode_cursor(comments[-1])})
+            request = self.context.get("request")
+            if request is not None:
+                next_url = request.build_absolute_uri(next_url)
+            count = obj.comment_set.count()
+        return {
+            "comment_count": count,
+            "comments": CommentSerializer(comments, many=True).data,
+            "comments_next": next_url,
+        }
     
     def get_chapter_summaries(self, obj):
-        ordered_chapters = obj.chapters.all().order_by('storychapters__order')
+        ordered_chapters = obj.chapters.all().order_by('storychapters__order', 'storychapters__pk')
         serializer = ChapterSummarySerializer(ordered_chapters, many=True)
         return serializer.data
 
@@ -136,16 +164,4 @@ class StoryCreatorSerializer(serializers.ModelSerializer):
         )
 
     def create(self, validated_data):
-        title = title=validated_data["title"]
-        slug = slugify(title)[:20]
-        i = 1
-        while Story.objects.filter(slug=slug).exists():
-            slug = slugify(self.title)[:20] + "-" + str(i)
-            i = i +1
-        story = Story.objects.create(
-            title=title,
-            slug = slug,
-            user=validated_data["user"],
-        )
-        story.save()
-        return story
+        return Story.objects.create_with_slug(validated_data["title"], user=validated_data["user"])
@@ -0,0 +1,153 @@
+from django.conf import settings
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from category.models import Category
+from config.response_cache import bump_versions
+from tag.models import Tag
+
+from . import facets, typeahead
+from .models import Chapter, ChapterContent, Story, StoryChapters, StorySearchDocument, chapters_changed
+from .search_backends import index_stories, index_story_metadata
+
+
+def deletion_started_by_chapter(origin):
+    # When a story or user is deleted its StoryChapters rows go with it;
+    # only a chapter (or StoryChapters row) deletion leaves a story behind
+    # that needs refreshing.
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model in (Chapter, StoryChapters)
+
+
+def touch_story(story_id):
+    # chapter order is part of the story detail payload, and its ETag
+    Story.objects.filter(pk=story_id).update(modified_at=timezone.now())
+    bump_versions("stories", f"story:{story_id}")
+
+
+@receiver(post_save, sender=Story)
+def story_saved(sender, instance, **kwargs):
+    index_story_metadata(instance)
+    bump_versions("stories", f"story:{instance.pk}")
+    typeahead.story_saved(instance)
+    facets.story_saved(instance)
+
+
+@receiver(post_save, sender=Chapter)
+def chapter_saved(sender, instance, **kwargs):
+    # titles show in the story detail; the text is handled below
+    story_ids = Story.objects.filter(chapters=instance).values_list("id", flat=True)
+    bump_versions(*(f"story:{story_id}" for story_id in story_ids))
+
+
+@receiver(post_save, sender=ChapterContent)
+def chapter_content_saved(sender, instance, **kwargs):
+    stories = Story.objects.filter(chapters=instance.chapter_id)
+    stories.refresh_excerpts()
+    story_ids = list(stories.values_list("id", flat=True))
+    index_stories(story_ids)
+    bump_versions("stories", *(f"story:{story_id}" for story_id in story_ids))
+
+
+@receiver(post_save, sender=StoryChapters)
+def story_chapters_saved(sender, instance, **kwargs):
+    touch_story(instance.story_id)
+    Story.objects.filter(pk=instance.story_id).refresh_excerpts()
+    index_stories([instance.story_id])
+
+
+@receiver(post_delete, sender=StoryChapters)
+def story_chapters_deleted(sender, instance, origin=None, **kwargs):
+    if not deletion_started_by_chapter(origin):
+        return
+    touch_story(instance.story_id)
+    Story.objects.filter(pk=instance.story_id).refresh_excerpts()
+    index_stories([instance.story_id])
+
+
+@receiver(chapters_changed)
+def story_chapters_changed(sender, story_id, **kwargs):
+    touch_story(story_id)
+    Story.objects.filter(pk=story_id).refresh_excerpts()
+    index_stories([story_id])
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and "alias" not in update_fields:
+        return
+    StorySearchDocument.objects.filter(story__user=instance).update(
+        author=instance.alias)
+    story_ids = Story.objects.filter(user=instance).values_list("id", flat=True)
+    bump_versions("stories", *(f"story:{story_id}" for story_id in story_ids))
+    typeahead.refresh_author(instance.pk)
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def user_deleted(sender, instance, **kwargs):
+    typeahead.discard(typeahead.AUTHOR, instance.pk)
+
+
+@receiver(post_save, sender=Tag)
+def tag_saved(sender, instance, **kwargs):
+    typeahead.put(typeahead.TAG, instance.pk, instance.name, instance.story_count)
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    typeahead.discard(typeahead.TAG, instance.pk)
+    facets.option_deleted("tags", instance.pk)
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    facets.option_deleted("categories", instance.pk)
+
+
+def affected_ids(instance, action, reverse, pk_set, field):
+    # ids on the Tag/Category side whose story_count may have changed
+    if reverse:
+        return [instance.pk]
+    if action == "pre_clear":
+        instance._cleared_ids = {
+            field: list(getattr(instance, field).values_list("id", flat=True))}
+        return []
+    if action == "post_clear":
+        return getattr(instance, "_cleared_ids", {}).pop(field, [])
+    if action in ("post_add", "post_remove"):
+        return pk_set
+    return []
+
+
+@receiver(m2m_changed, sender=Story.tags.through)
+def story_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    ids = affected_ids(instance, action, reverse, pk_set, "tags")
+    if ids:
+        Tag.objects.filter(id__in=ids).refresh_story_counts()
+        typeahead.refresh_tags(ids)
+    facets.memberships_changed("tags", instance, action, reverse, pk_set, ids)
+
+
+@receiver(m2m_changed, sender=Story.categories.through)
+def story_categories_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    ids = affected_ids(instance, action, reverse, pk_set, "categories")
+    if ids:
+        Category.objects.filter(id__in=ids).refresh_story_counts()
+    facets.memberships_changed("categories", instance, action, reverse, pk_set, ids)
+
+
+@receiver(pre_delete, sender=Story)
+def story_deleting(sender, instance, **kwargs):
+    instance._deleted_tag_ids = list(instance.tags.values_list("id", flat=True))
+    instance._deleted_category_ids = list(instance.categories.values_list("id", flat=True))
+
+
+@receiver(post_delete, sender=Story)
+def story_deleted(sender, instance, **kwargs):
+    bump_versions("stories", f"story:{instance.pk}")
+    Tag.objects.filter(id__in=instance._deleted_tag_ids).refresh_story_counts()
+    Category.objects.filter(id__in=instance._deleted_category_ids).refresh_story_counts()
+    typeahead.story_deleted(instance.pk, instance.user_id, instance._deleted_tag_ids)
+    facets.story_deleted(instance.pk, instance._deleted_tag_ids, instance._deleted_category_ids)
@@ -1,11 +1,16 @@
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from rest_framework import generics, status
-from rest_framework.exceptions import NotFound
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
 from django.http import HttpResponseNotFound
 from accounts.permissions import IsAuth, IsAuthor, IsOwnerOrAdmin
 from category.models import Category
+from config.response_cache import CachedResponseMixin
 from tag.models import Tag
 
+from .conditional import story_etag
+from .export import CONTENT_TYPES, export_response
 from .models import Story
 from .serializers import (
     StorySerializer,
@@ -13,7 +18,6 @@ from .serializers import (
     StoryCreatorSerializer
 )
 
-from tag.serializers import TagSearchSerializer
     
 class StoryRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
     lookup_field = "id"
@@ -21,12 +25,25 @@ class StoryRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = StorySerializer
     permission_classes = [IsAuthor]
 
-class StoryDetailAPIView(generics.RetrieveAPIView):
+@method_decorator(condition(etag_func=story_etag), name="get")
+class StoryDetailAPIView(CachedResponseMixin, generics.RetrieveAPIView):
     lookup_field = "id"
+    cache_versions = ("story:{id}", "tags", "categories")
     queryset = Story.objects.all()
     serializer_class = StoryDetailSerializer
     permission_classes = []
 
+class StoryExportAPIView(generics.GenericAPIView):
+    permission_classes = []
+
+    def get(self, request, *args, **kwargs):
+        if self.kwargs["fmt"] not in CONTENT_TYPES:
+            raise NotFound("Unknown export format")
+        story = Story.objects.select_related("user").filter(id=self.kwargs["id"]).first()
+        if story is None:
+            raise NotFound("Story does not exist")
+        return export_response(story, self.kwargs["fmt"])
+
 class StoryCreateAPIView(generics.CreateAPIView):
     serializer_class = StoryCreatorSerializer
     permission_classes = [IsAuthor]
@@ -57,22 +74,9 @@ class StorySaveAPIView(generics.UpdateAPIView):
         story = self.get_object()
         data = request.data.copy()
 
-        tags = data.pop("tags", [])
-        if tags:
-            new_tags = [x for x in tags if not x.get('id')]
-            tag_ids = [x['id'] for x in tags if x.get('id')]            
-            for (tag) in new_tags:
-                existing_tag = Tag.objects.filter(name__iexact=tag["name"])
-                if (existing_tag):
-                    tag_ids.append(existing_tag.id)
-                else:
-                    serializer = TagSearchSerializer(data=tag)
-                    if (serializer.is_valid()):
-                        new_tag = serializer.save(user=self.request.user)
-                        tag_ids.append(new_tag.id)
-            data["tags"] = list(tag_ids)
-        else:
-            data["tags"] = []
+        # resolved below in bulk rather than one by one by the serializer
+        tags = data.pop("tags", None) or []
+        data["tags"] = []
 
         categories = data.pop("categories", [])
         if categories:
@@ -92,7 +96,7 @@ class StorySaveAPIView(generics.UpdateAPIView):
             title = serializer.validated_data["title"]
             is_published = serializer.validated_data["is_published"]
             has_chapters = serializer.validated_data["has_chapters"]
-            tags = serializer.validated_data["tags"]
+            tags = self.resolve_tags(tags)
             categories = serializer.validated_data["categories"]
             story.title = title
             story.is_published = is_published
@@ -103,7 +107,20 @@ class StorySaveAPIView(generics.UpdateAPIView):
             return Response({"status": "story saved"})
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-        
+
+    def resolve_tags(self, tags):
+        # existing tags come by id, new ones by name
+        tag_ids = {tag["id"] for tag in tags if tag.get("id")}
+        existing = list(Tag.objects.filter(id__in=tag_ids)) if tag_ids else []
+        if len(existing) != len(tag_ids):
+            raise ValidationError({"tags": ["Tag not found!"]})
+        max_length = Tag._meta.get_field("name").max_length
+        names = [
+            tag["name"] for tag in tags
+            if not tag.get("id") and tag.get("name") and len(tag["name"].strip()) <= max_length
+        ]
+        return existing + Tag.objects.resolve(names, user=self.request.user)
+
 class AddSavedStoryAPIView(generics.UpdateAPIView):
     serializer_class = StorySerializer
     permission_classes = [IsAuth]
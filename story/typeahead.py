@@ -0,0 +1,233 @@
+"""
+Typeahead suggestions for tag names, author aliases and story titles.
+
+Every process keeps a sorted list of normalized keys in memory, one key
+for the whole name and one for each later word in it, so "dark" finds
+"The Dark Tower". A prefix is two binary searches into that list. Short
+prefixes match a large part of the list, so their ranked results are
+kept, and adjusted as names are added and removed.
+
+The index is a story.local_index.LocalIndex, kept current by the
+receivers in story.signals.
+"""
+import heapq
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Q
+
+from tag.models import Tag, normalize_name
+
+from .local_index import LocalIndex
+from .models import Story
+
+TAG = "tag"
+AUTHOR = "author"
+STORY = "story"
+KINDS = (TAG, AUTHOR, STORY)
+
+MAX_LIMIT = 25
+MAX_WORDS = 8
+# prefixes matching more keys than this have their results kept
+KEEP_RESULTS_OVER = 256
+LAST = chr(0x10FFFF)
+
+Entry = namedtuple("Entry", ["kind", "id", "label", "weight", "normalized"])
+
+
+def entry_keys(normalized):
+    keys = [normalized]
+    position = normalized.find(" ")
+    while position != -1 and len(keys) < MAX_WORDS:
+        key = normalized[position:].lstrip()
+        if key and key != keys[-1]:
+            keys.append(key)
+        position = normalized.find(" ", position + 1)
+    return keys
+
+
+def rank(entry, prefix):
+    # whole name, then name starting with the prefix, then word in the name
+    return (
+        entry.normalized != prefix,
+        not entry.normalized.startswith(prefix),
+        -entry.weight,
+        len(entry.label),
+        entry.normalized,
+    )
+
+
+class PrefixIndex:
+    def __init__(self, entries=()):
+        self.entries = {}
+        pairs = []
+        for entry in entries:
+            self.entries[entry.kind, entry.id] = entry
+            pairs.extend((key, entry) for key in entry_keys(entry.normalized))
+        pairs.sort(key=lambda pair: pair[0])
+        self.keys = [key for key, _ in pairs]
+        self.owners = [entry for _, entry in pairs]
+        self.kept = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def copy(self):
+        index = PrefixIndex()
+        index.entries = dict(self.entries)
+        index.keys = list(self.keys)
+        index.owners = list(self.owners)
+        # suggest() may add to kept meanwhile; dict() copies in one step
+        # under the GIL, and adjust_kept() replaces the lists it changes
+        index.kept = {prefix: dict(kept) for prefix, kept in dict(self.kept).items()}
+        return index
+
+    def put(self, kind, id, label, weight=0):
+        old = self.remove(kind, id)
+        entry = Entry(kind, id, label, weight, normalize_name(label))
+        if not entry.normalized:
+            self.adjust_kept(old, None)
+            return
+        self.entries[kind, id] = entry
+        for key in entry_keys(entry.normalized):
+            position = bisect_right(self.keys, key)
+            self.keys.insert(position, key)
+            self.owners.insert(position, entry)
+        self.adjust_kept(old, entry)
+
+    def discard(self, kind, id):
+        self.adjust_kept(self.remove(kind, id), None)
+
+    def remove(self, kind, id):
+        entry = self.entries.pop((kind, id), None)
+        if entry is not None:
+            for key in entry_keys(entry.normalized):
+                position = bisect_left(self.keys, key)
+                while self.owners[position] is not entry:
+                    position += 1
+                del self.keys[position]
+                del self.owners[position]
+        return entry
+
+    def adjust_kept(self, old, new):
+        prefixes = set()
+        for entry in filter(None, (old, new)):
+            for key in entry_keys(entry.normalized):
+                prefixes.update(key[:end] for end in range(1, len(key) + 1))
+        for prefix in prefixes.intersection(self.kept):
+            kept = self.kept[prefix]
+            for kinds, results in list(kept.items()):
+                if old in results:
+                    if len(results) == MAX_LIMIT:
+                        # whatever comes next isn't known, find out on the next call
+                        del kept[kinds]
+                        continue
+                    results = [entry for entry in results if entry != old]
+                if new and new.kind in kinds and any(
+                        key.startswith(prefix) for key in entry_keys(new.normalized)):
+                    results = sorted(results + [new], key=lambda entry: rank(entry, prefix))
+                    del results[MAX_LIMIT:]
+                kept[kinds] = results
+
+    def suggest(self, prefix, kinds=KINDS, limit=10):
+        prefix = normalize_name(prefix)
+        if not prefix:
+            return []
+        kinds = tuple(kind for kind in KINDS if kind in kinds)
+        kept = self.kept.get(prefix, {}).get(kinds)
+        if kept is not None:
+            return kept[:limit]
+        start = bisect_left(self.keys, prefix)
+        end = bisect_right(self.keys, prefix + LAST, start)
+        matches = {entry for entry in self.owners[start:end] if entry.kind in kinds}
+        if end - start <= KEEP_RESULTS_OVER:
+            return heapq.nsmallest(limit, matches, key=lambda entry: rank(entry, prefix))
+        results = heapq.nsmallest(MAX_LIMIT, matches, key=lambda entry: rank(entry, prefix))
+        self.kept.setdefault(prefix, {})[kinds] = results
+        return results[:limit]
+
+
+def authors():
+    return get_user_model().objects.annotate(
+        published=Count("story", filter=Q(story__is_published=True))
+    ).filter(published__gt=0).values_list("id", "alias", "published")
+
+
+def load_entries():
+    for id, name, story_count in Tag.objects.values_list("id", "name", "story_count").iterator():
+        yield Entry(TAG, id, name, story_count, normalize_name(name))
+    for id, alias, published in authors().iterator():
+        yield Entry(AUTHOR, id, alias, published, normalize_name(alias))
+    stories = Story.objects.filter(is_published=True).values_list("id", "title")
+    for id, title in stories.iterator():
+        yield Entry(STORY, id, title, 0, normalize_name(title))
+
+
+local = LocalIndex(
+    "typeahead", lambda: PrefixIndex(entry for entry in load_entries() if entry.normalized))
+
+
+def get_index():
+    return local.get()
+
+
+def change(puts=(), discards=()):
+    # one change, so one copy of the index, for everything a write touched
+    if not puts and not discards:
+        return
+
+    def update(index):
+        for kind, id in discards:
+            index.discard(kind, id)
+        for kind, id, label, weight in puts:
+            index.put(kind, id, label, weight)
+    local.changed(update)
+
+
+def put(kind, id, label, weight=0):
+    change(puts=[(kind, id, label, weight)])
+
+
+def discard(kind, id):
+    change(discards=[(kind, id)])
+
+
+def tag_changes(tag_ids):
+    tags = Tag.objects.filter(id__in=tag_ids).values_list("id", "name", "story_count")
+    return [(TAG, id, name, story_count) for id, name, story_count in tags]
+
+
+def author_changes(user_id):
+    # (puts, discards) bringing the author up to date
+    author = authors().filter(id=user_id).first()
+    if author:
+        return [(AUTHOR, *author)], []
+    return [], [(AUTHOR, user_id)]
+
+
+def refresh_tags(tag_ids):
+    if local.built:
+        change(puts=tag_changes(tag_ids))
+
+
+def refresh_author(user_id):
+    if local.built:
+        change(*author_changes(user_id))
+
+
+def story_saved(story):
+    puts, discards = author_changes(story.user_id) if local.built else ([], [])
+    if story.is_published:
+        puts.append((STORY, story.pk, story.title, 0))
+    else:
+        discards.append((STORY, story.pk))
+    change(puts, discards)
+
+
+def story_deleted(story_id, user_id, tag_ids):
+    puts, discards = author_changes(user_id) if local.built else ([], [])
+    if local.built:
+        puts.extend(tag_changes(tag_ids))
+    discards.append((STORY, story_id))
+    change(puts, discards)
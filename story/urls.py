@@ -4,6 +4,7 @@ from .story_views import (
     StorySaveAPIView,
     StoryCreateAPIView,
     StoryDetailAPIView,
+    StoryExportAPIView,
     StoryRetrieveUpdateDestroyAPIView,
     AddSavedStoryAPIView,
     DeleteSavedStoryAPIView,
@@ -11,16 +12,20 @@ from .story_views import (
 )
 
 from .chapter_views import (
+    ChapterBulkCreateAPIView,
     ChapterCreateAPIView,
     ChapterDetailAPIView,
     ChapterSaveAPIView,
     ChapterDeleteAPIView,
+    ChapterReorderAPIView,
+    StoryChaptersAPIView,
 )
 
 from .search_views import (
     SearchStoryView,
     SearchAuthorView,
     SearchTagView,
+    SuggestView,
     SavedStoriesAPIView,
     StoryFeaturedAPIView,
     StoryListAPIView,
@@ -30,6 +35,7 @@ from .search_views import (
 )
 
 from .by_views import (
+    BrowseView,
     ByCategoryView,
     ByTagView,
     ByAuthorView
@@ -49,6 +55,7 @@ urlpatterns = [
     path("/add/", StoryCreateAPIView.as_view(), name="story-create"),
     path("/save-story/<int:id>/", StorySaveAPIView.as_view(), name="story-save"),
     path("/detail/<int:id>/", StoryDetailAPIView.as_view(), name="story-detail"),
+    path("/export/<int:id>/<str:fmt>/", StoryExportAPIView.as_view(), name="story-export"),
     path("/check-author/<int:id>/", StoryCheckAuthorAPIView.as_view(), name="story-check-author"),
 
     # saved stories
@@ -58,14 +65,18 @@ urlpatterns = [
 
     #chapter paths
     path("/chapter/<int:id>/", ChapterDetailAPIView.as_view(), name="chapter-detail"),
+    path("/<int:storyid>/chapters/", StoryChaptersAPIView.as_view(), name="story-chapters"),
     path("/<int:storyid>/chapter-add/", ChapterCreateAPIView.as_view(), name="chapter-create"),
+    path("/<int:storyid>/chapter-bulk-add/", ChapterBulkCreateAPIView.as_view(), name="chapter-bulk-create"),
     path("/<int:storyid>/chapter-save/<int:id>/", ChapterSaveAPIView.as_view(), name="chapter-save"),
     path("/<int:storyid>/chapter-delete/<int:id>/", ChapterDeleteAPIView.as_view(), name="chapter-delete"),
+    path("/<int:storyid>/chapter-reorder/", ChapterReorderAPIView.as_view(), name="chapter-reorder"),
 
     #search and list views
     path("/search/story", SearchStoryView.as_view(), name="search-story"),
     path("/search/author", SearchAuthorView.as_view(), name="search-author"),
     path("/search/tag", SearchTagView.as_view(), name="search-tag"),
+    path("/search/suggest", SuggestView.as_view(), name="search-suggest"),
     path("/list/", StoryListAPIView.as_view(), name="story-list"),
     path("/list/author/", ListAuthorView.as_view(), name="author-list"),
     path("/list-admin/", StoryListAdminAPIView.as_view(), name="story-list-admin"),
@@ -76,6 +87,7 @@ urlpatterns = [
     path("/bycategory/<int:id>", ByCategoryView.as_view(), name="by-category"),
     path("/bytag/<int:id>", ByTagView.as_view(), name="by-tag"),
     path("/byauthor/<int:id>", ByAuthorView.as_view(), name="by-author"),
+    path("/browse/", BrowseView.as_view(), name="browse"),
 
 
     
@@ -0,0 +1,96 @@
+import html
+import re
+import unicodedata
+
+from django.utils.html import linebreaks, strip_tags
+from django.utils.text import Truncator
+
+EXCERPT_WORDS = 50
+SNIPPET_CHARS_BEFORE = 60
+SNIPPET_CHARS_AFTER = 160
+
+
+def normalize_body(body):
+    """
+    Canonical form of a chapter body as stored: NFC, \n line endings and
+    no surrounding whitespace
+    """
+    if not body:
+        return ""
+    body = body.replace("\r\n", "\n").replace("\r", "\n")
+    return unicodedata.normalize("NFC", body).strip()
+
+
+def has_markup(body):
+    # only imported chapters are allowed to carry HTML
+    return strip_tags(body) != body
+
+
+def render_body(body):
+    """
+    Chapter body ready to serve as HTML: imported HTML as it is, plain text
+    escaped and split into paragraphs on blank lines
+    """
+    if not body:
+        return ""
+    if has_markup(body):
+        return body
+    return linebreaks(body, autoescape=True)
+
+
+def make_plain_text(body):
+    """
+    Chapter body with HTML entities and tags removed
+    """
+    if not body:
+        return ""
+    return strip_tags(html.unescape(body))
+
+
+def make_excerpt(text):
+    """
+    Plain text teaser for story cards: the first EXCERPT_WORDS words of a
+    chapter's plain text
+    """
+    if not text:
+        return ""
+    return Truncator(text).words(EXCERPT_WORDS, truncate="...")
+
+
+def make_snippet(text, tokens):
+    """
+    A short, HTML-escaped window of plain text around the first word
+    starting with one of tokens, with every such word wrapped in <mark>.
+    None when nothing matches.
+    """
+    if not text or not tokens:
+        return None
+    pattern = re.compile(
+        r"\b(?:%s)\w*" % "|".join(re.escape(token) for token in tokens),
+        re.IGNORECASE,
+    )
+    match = pattern.search(text)
+    if not match:
+        return None
+
+    start = max(0, match.start() - SNIPPET_CHARS_BEFORE)
+    end = min(len(text), match.end() + SNIPPET_CHARS_AFTER)
+    # don't cut words in half at either edge
+    if start > 0:
+        space = text.find(" ", start, match.start())
+        start = space + 1 if space != -1 else match.start()
+    if end < len(text):
+        space = text.rfind(" ", match.end(), end)
+        end = space if space != -1 else match.end()
+    window = " ".join(text[start:end].split())
+
+    parts = []
+    position = 0
+    for found in pattern.finditer(window):
+        parts.append(html.escape(window[position:found.start()]))
+        parts.append("<mark>%s</mark>" % html.escape(found.group()))
+        position = found.end()
+    parts.append(html.escape(window[position:]))
+    prefix = "..." if start > 0 else ""
+    suffix = "..." if end < len(text) else ""
+    return prefix + "".join(parts) + suffix
@@ -0,0 +1,65 @@
+# Generated by Django 5.1.4 on 2026-10-18 21:20
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def normalize_name(name):
+    return name.strip().casefold()
+
+
+def merge_case_duplicates(apps, schema_editor):
+    """
+    Fold tags whose names differ only in case into one, the tag with the
+    most stories (the oldest on a tie), moving their stories over, then
+    fill name_normalized.
+    """
+    Tag = apps.get_model("tag", "Tag")
+    through = apps.get_model("story", "Story").tags.through
+
+    groups = defaultdict(list)
+    for tag in Tag.objects.order_by("id").only("id", "name", "story_count"):
+        groups[normalize_name(tag.name)].append(tag)
+
+    for tags in groups.values():
+        if len(tags) < 2:
+            continue
+        keeper = max(tags, key=lambda tag: (tag.story_count, -tag.id))
+        duplicate_ids = [tag.id for tag in tags if tag.id != keeper.id]
+        tagged = set(through.objects.filter(tag_id=keeper.id).values_list("story_id", flat=True))
+        moved = set(
+            through.objects.filter(tag_id__in=duplicate_ids)
+            .exclude(story_id__in=tagged)
+            .values_list("story_id", flat=True)
+        )
+        through.objects.bulk_create([through(story_id=story_id, tag_id=keeper.id) for story_id in moved])
+        Tag.objects.filter(id__in=duplicate_ids).delete()
+        Tag.objects.filter(id=keeper.id).update(story_count=len(tagged | moved))
+
+    tags = list(Tag.objects.only("id", "name"))
+    for tag in tags:
+        tag.name_normalized = normalize_name(tag.name)
+    Tag.objects.bulk_update(tags, ["name_normalized"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tag', '0005_story_count'),
+        ('story', '0001_squashed_0017_alter_story_slug'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='name_normalized',
+            field=models.CharField(editable=False, max_length=100, null=True),
+        ),
+        migrations.RunPython(merge_case_duplicates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='tag',
+            name='name_normalized',
+            field=models.CharField(editable=False, max_length=100, unique=True),
+        ),
+    ]
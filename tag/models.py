@@ -1,16 +1,89 @@
 from django.conf import settings
 from django.db import models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from config.response_cache import bump_versions
+
+
+def normalize_name(name):
+    # what makes two tag names the same tag
+    return name.strip().casefold()
+
+
+class TagQuerySet(models.QuerySet):
+    def refresh_story_counts(self):
+        # one UPDATE for the whole set, counted from the story m2m table
+        through = self.model.story_set.through
+        counts = (
+            through.objects.filter(tag_id=OuterRef("pk"))
+            .order_by().values("tag_id")
+            .annotate(count=Count("pk")).values("count")
+        )
+        updated = self.update(story_count=Coalesce(Subquery(counts), 0))
+        # update() sends no signals
+        bump_versions("tags")
+        return updated
+
+    def named(self, names):
+        # case-insensitive, for any number of names, off the unique index
+        return self.filter(name_normalized__in=[normalize_name(name) for name in names])
+
+    def prefixed(self, prefix):
+        # The column is already folded; istartswith rather than startswith
+        # because MySQL runs startswith as LIKE BINARY, which its
+        # case-insensitive index can't serve.
+        return self.filter(name_normalized__istartswith=normalize_name(prefix))
+
+    def resolve(self, names, user=None):
+        """
+        The tags called names, as normalize_name sees them, creating the
+        missing ones: one lookup, plus one bulk insert and one more lookup
+        when some are new. A tag created concurrently under the same name is a conflict
+        the insert skips and the second lookup finds, so don't call this
+        inside a transaction that has already read tags: under MySQL's
+        REPEATABLE READ, the second lookup wouldn't see the other insert.
+        """
+        wanted = {}
+        for name in names:
+            name = name.strip()
+            if name:
+                wanted.setdefault(normalize_name(name), name)
+        if not wanted:
+            return []
+        tags = list(self.named(wanted.values()))
+        missing = wanted.keys() - {tag.name_normalized for tag in tags}
+        if missing:
+            self.bulk_create(
+                [self.model(name=wanted[key], name_normalized=key, user=user) for key in missing],
+                ignore_conflicts=True,
+            )
+            # bulk_create sends no signals
+            bump_versions("tags")
+            tags = list(self.named(wanted.values()))
+        return tags
 
 
 # Create your models here.
 class Tag(models.Model):
     name = models.CharField(max_length=50, unique=True)
+    # normalize_name(name): one tag per name whatever the case, and the
+    # column that exact and prefix lookups go through
+    name_normalized = models.CharField(max_length=100, unique=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE, blank=True, null=True
     )
     old_brawna_term_id = models.IntegerField(null=True, blank=True)
+    # maintained by story.signals, rebuilt by rebuild_story_counts
+    story_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = TagQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        self.name_normalized = normalize_name(self.name)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
@@ -1,20 +1,22 @@
 from rest_framework import serializers
-from django.db.models import Count
 
-from story.models import Story
 from .models import Tag
 
 
 class TagSerializer(serializers.ModelSerializer):
-    story_count = serializers.SerializerMethodField()
-
     class Meta:
         model = Tag
         fields = ["name","id", "story_count"]
-        read_only_fields = ["id", "created_at", "modified_at", "user"]
+        read_only_fields = ["id", "created_at", "modified_at", "user", "story_count"]
 
-    def get_story_count(self, obj):
-        return Story.objects.filter(tags__id=obj.id).count()
+    def validate_name(self, value):
+        # names differing only in case are the same tag
+        others = Tag.objects.named([value])
+        if self.instance is not None:
+            others = others.exclude(pk=self.instance.pk)
+        if others.exists():
+            raise serializers.ValidationError("tag with this name already exists.")
+        return value
 
 class TagIdSerializer(serializers.ModelSerializer):
     class Meta:
@@ -23,12 +25,7 @@ class TagIdSerializer(serializers.ModelSerializer):
         read_only_fields = ["id"] 
 
 class TagSearchSerializer(serializers.ModelSerializer):
-    story_count = serializers.SerializerMethodField()
-
     class Meta:
         model = Tag
         fields = ["name","id", "story_count"]
-        read_only_fields = ["id", "created_at", "modified_at", "user"]
-
-    def get_story_count(self, obj):
-        return Story.objects.filter(tags__id=obj.id).count()
\ No newline at end of file
+        read_only_fields = ["id", "created_at", "modified_at", "user", "story_count"]
@@ -1,8 +1,15 @@
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import IntegrityError
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
 
-from tag.models import Tag
+from accounts.models import User
+from story.models import Story
+from tag.models import Tag, TagQuerySet
 
 
 class TagListAPIViewTest(APITestCase):
@@ -24,9 +31,167 @@ class TagListAPIViewTest(APITestCase):
         self.assertEqual(len(response.data["results"]), 1)
         self.assertEqual(response.data["results"][0]["name"], self.tag1.name)
 
+    def test_query_is_a_case_insensitive_prefix(self):
+        Tag.objects.create(name="Pretest")
+        response = self.client.get(self.url, {"q": "TEST"})
+        self.assertEqual([tag["name"] for tag in response.data["results"]], [self.tag1.name, self.tag2.name])
+
     def test_pagination(self):
         for i in range(24):
             Tag.objects.create(name=f"mytest{i}")
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data["results"]), 12)
+
+    def test_orders_by_story_count(self):
+        user = User.objects.create_user(username="testuser", password="testpassword")
+        story = Story.objects.create(title="story", slug="story", user=user)
+        story.tags.add(self.tag2)
+        response = self.client.get(self.url)
+        self.assertEqual(response.data["results"][0]["name"], self.tag2.name)
+        self.assertEqual(response.data["results"][0]["story_count"], 1)
+
+    def test_reads_stored_story_count(self):
+        for i in range(24):
+            Tag.objects.create(name=f"mytest{i}")
+        # count and page, no per-row counting
+        with self.assertNumQueries(2):
+            self.client.get(self.url)
+
+
+class TagStoryCountTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.tag1 = Tag.objects.create(name="test1")
+        self.tag2 = Tag.objects.create(name="test2")
+        self.story1 = Story.objects.create(title="story1", slug="story1", user=self.user)
+        self.story2 = Story.objects.create(title="story2", slug="story2", user=self.user)
+
+    def assertCounts(self, tag1, tag2):
+        self.tag1.refresh_from_db()
+        self.tag2.refresh_from_db()
+        self.assertEqual((self.tag1.story_count, self.tag2.story_count), (tag1, tag2))
+
+    def test_add(self):
+        self.story1.tags.add(self.tag1, self.tag2)
+        self.story2.tags.add(self.tag1)
+        self.assertCounts(2, 1)
+
+    def test_add_existing_does_not_double_count(self):
+        self.story1.tags.add(self.tag1)
+        self.story1.tags.add(self.tag1)
+        self.assertCounts(1, 0)
+
+    def test_remove(self):
+        self.story1.tags.add(self.tag1, self.tag2)
+        self.story1.tags.remove(self.tag1)
+        self.story1.tags.remove(self.tag1)
+        self.assertCounts(0, 1)
+
+    def test_set(self):
+        self.story1.tags.add(self.tag1)
+        self.story1.tags.set([self.tag2])
+        self.assertCounts(0, 1)
+
+    def test_clear(self):
+        self.story1.tags.add(self.tag1, self.tag2)
+        self.story1.tags.clear()
+        self.assertCounts(0, 0)
+
+    def test_reverse_add_and_clear(self):
+        self.tag1.story_set.add(self.story1, self.story2)
+        self.assertCounts(2, 0)
+        self.tag1.story_set.clear()
+        self.assertCounts(0, 0)
+
+    def test_story_delete(self):
+        self.story1.tags.add(self.tag1)
+        self.story2.tags.add(self.tag1, self.tag2)
+        self.story2.delete()
+        self.assertCounts(1, 0)
+
+    def test_rebuild_command(self):
+        self.story1.tags.add(self.tag1, self.tag2)
+        Tag.objects.update(story_count=7)
+        call_command("rebuild_story_counts", stdout=StringIO())
+        self.assertCounts(1, 1)
+
+
+class TagResolveTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.cat = Tag.objects.create(name="cat")
+
+    def test_matches_case_insensitively_and_creates_the_rest(self):
+        # lookup, insert, lookup
+        with self.assertNumQueries(3):
+            tags = Tag.objects.resolve(["CAT", " dog ", "Dog", "", "mouse"], user=self.user)
+        self.assertEqual(sorted(tag.name for tag in tags), ["cat", "dog", "mouse"])
+        self.assertEqual(Tag.objects.get(name="dog").user, self.user)
+        self.assertEqual(Tag.objects.count(), 3)
+
+    def test_all_known_is_one_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(Tag.objects.resolve(["Cat"]), [self.cat])
+
+    def test_tag_created_concurrently_is_found(self):
+        named = TagQuerySet.named
+        calls = []
+
+        def named_after_race(queryset, names):
+            # the first lookup runs before another request creates "cat",
+            # which name_normalized then makes a conflict
+            calls.append(names)
+            return queryset.none() if len(calls) == 1 else named(queryset, names)
+
+        with patch.object(TagQuerySet, "named", named_after_race):
+            tags = Tag.objects.resolve(["CAT"])
+        self.assertEqual(tags, [self.cat])
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(Tag.objects.count(), 1)
+
+
+class TagAddAPIViewTest(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create(username="admin", email="admin@example.com", type="administrator")
+        self.client.force_authenticate(user=self.admin)
+        self.cat = Tag.objects.create(name="cat")
+        self.url = reverse("tag:tag-add")
+
+    def test_new_name_is_created(self):
+        response = self.client.post(self.url, {"name": "Dog"})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Tag.objects.get(id=response.data["id"]).name_normalized, "dog")
+
+    def test_name_differing_in_case_returns_existing(self):
+        response = self.client.post(self.url, {"name": " CAT"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["id"], self.cat.id)
+        self.assertEqual(Tag.objects.count(), 1)
+
+    def test_normalized_name_is_unique(self):
+        with self.assertRaises(IntegrityError):
+            Tag.objects.create(name="Cat")
+
+
+class TagUpdateViewTest(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create(username="admin", email="admin@example.com", type="administrator")
+        self.client.force_authenticate(user=self.admin)
+        self.cats = Tag.objects.create(name="catz")
+        Tag.objects.create(name="dogz")
+
+    def rename(self, name):
+        url = reverse("tag:tag-update", kwargs={"name": "catz"})
+        return self.client.put(url, {"name": name})
+
+    def test_name_of_another_tag_in_other_case_is_rejected(self):
+        response = self.rename("DOGZ")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("name", response.data)
+
+    def test_own_name_in_other_case_is_accepted(self):
+        response = self.rename("Catz")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.cats.refresh_from_db()
+        self.assertEqual((self.cats.name, self.cats.name_normalized), ("Catz", "catz"))
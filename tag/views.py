@@ -1,7 +1,6 @@
 from rest_framework import generics, status
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
-from django.db.models import Count
 
 from accounts.permissions import IsAdmin
 from tag.models import Tag
@@ -18,9 +17,9 @@ class TagListAPIView(generics.ListAPIView):
     def get_queryset(self):
         query = self.request.GET.get("q")
         if query:
-            return Tag.objects.filter(name__icontains=query).order_by("name")
+            return Tag.objects.prefixed(query).order_by("name_normalized")
         else:
-            return Tag.objects.annotate(story_count=Count('story')).order_by("-story_count")
+            return Tag.objects.order_by("-story_count", "id")
 
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
@@ -36,15 +35,14 @@ class TagAddAPIView(generics.CreateAPIView):
     serializer_class = TagSerializer
     permission_classes = [IsAdmin]
 
-    def perform_create(self, serializer):
-        data = self.request.data.copy()
-        name = data.pop("name")
-        existing_tag = Tag.objects.filter(name__iexact=name)
-        if (existing_tag):
-            return Response(existing_tag,status=status.HTTP_200_OK)
+    def create(self, request, *args, **kwargs):
+        existing_tag = Tag.objects.named([request.data.get("name", "")]).first()
+        if existing_tag:
+            return Response(self.get_serializer(existing_tag).data, status=status.HTTP_200_OK)
+        return super().create(request, *args, **kwargs)
 
+    def perform_create(self, serializer):
         serializer.save(user=self.request.user)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 class TagUpdateView(generics.UpdateAPIView):
     lookup_field = "name"